@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares stream download throughput on a local test server
+"old" reads small chunks and writes each one on the event loop (the former save_chunk),
+"new" uses the read size and StreamWriter of gyre.writer
+"""
+
+import argparse
+import asyncio
+import pathlib
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from gyre import writer  # noqa: E402
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+PORT = 8765
+# Default of the download-chunk-size setting
+OLD_CHUNK_SIZE = 1024
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+async def save_old(stream, f):
+    while True:
+        chunk = await stream.content.read(OLD_CHUNK_SIZE)
+        if not chunk:
+            break
+        f.write(chunk)
+
+
+async def save_new(stream, f):
+    # Same as get_read_size, minus the lookup of the (lower) chunk size setting
+    length = stream.content_length
+    size = max(writer.MIN_READ_SIZE, min(length // writer.READS_PER_STREAM, writer.MAX_READ_SIZE))
+    async with writer.StreamWriter(f) as w:
+        while True:
+            chunk = await stream.content.read(size)
+            if not chunk:
+                break
+            await w.write(chunk)
+
+
+async def download(session, url, path, save):
+    async with session.get(url) as stream:
+        with path.open("wb") as f:
+            await save(stream, f)
+
+
+async def measure(save, streams, size, folder):
+    url = f"http://127.0.0.1:{PORT}/stream"
+    async with ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            download(session, url, folder / f"{i}.bin", save) for i in range(streams)
+        ])
+        elapsed = time.perf_counter() - start
+
+    for i in range(streams):
+        if (folder / f"{i}.bin").stat().st_size != size:
+            raise RuntimeError("Incomplete download")
+
+    return streams*size/elapsed/1024/1024
+
+
+async def main(args):
+    size = args.size*1024*1024
+    payload = bytes(range(256))*(size//256)
+
+    async def handler(request):
+        return web.Response(body=payload)
+
+    app = web.Application()
+    app.router.add_get("/stream", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="gyre-benchmark-") as folder:
+            for name, save in [("old", save_old), ("new", save_new)]:
+                rates = [await measure(save, args.streams, size, pathlib.Path(folder)) for _ in range(args.runs)]
+                print(f"{name}: {max(rates):.1f} MiB/s (best of {args.runs}, {args.streams}x {args.size} MiB)")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=20, help="stream size in MiB")
+    parser.add_argument("--streams", type=int, default=4, help="parallel streams")
+    parser.add_argument("--runs", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
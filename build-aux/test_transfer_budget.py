@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Downloads more coubs with in-memory audio than fit into the transfer budget
+The downloads must neither deadlock nor leave anything of the budget behind
+"""
+
+import asyncio
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import types
+
+from aiohttp import ClientSession, web
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+DOMAIN = "io.github.helpseeker.Gyre"
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+PORT = 8766
+COUBS = 6
+# Two audio buffers alone fit into the smallest budget (1 MiB), the videos on top don't
+STREAM_SIZE = 384*1024
+TIMEOUT = 60
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def use_test_settings(folder):
+    # Settings only live in memory, so the test never touches the user's configuration
+    os.environ["GSETTINGS_BACKEND"] = "memory"
+    if "GSETTINGS_SCHEMA_DIR" in os.environ:
+        return
+
+    source = (ROOT / "data" / f"{DOMAIN}.gschema.xml.in").read_text()
+    source = source.replace("@DOMAIN@", DOMAIN).replace("@PATH@", "/".join(DOMAIN.split(".")))
+    (folder / f"{DOMAIN}.gschema.xml").write_text(source)
+    subprocess.run(["glib-compile-schemas", str(folder)], check=True)
+    os.environ["GSETTINGS_SCHEMA_DIR"] = str(folder)
+
+
+async def main(folder):
+    from gyre import budget, concurrency, limiter
+    from gyre.coub import Coub
+    from gyre.settings import Settings
+
+    settings = Settings.get_default()
+    settings.transfer_size_limit = 1
+    settings.keep_streams = False
+    settings.download_segments = 1
+
+    payload = os.urandom(STREAM_SIZE)
+
+    async def handler(request):
+        return web.Response(body=payload)
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    budget.init()
+    concurrency.init()
+    limiter.init()
+    container = types.SimpleNamespace(streams=0, add_bytes=lambda amount, reused=False: None)
+
+    async def download(coub):
+        await coub._download()
+        buffered = coub.audio_data is not None
+        coub._clean_up()
+        return buffered
+
+    try:
+        async with ClientSession() as session:
+            coubs = []
+            for i in range(COUBS):
+                coub = Coub(f"c{i}", container, session)
+                coub.video = coub.audio = True
+                coub.video_link = f"http://127.0.0.1:{PORT}/v{i}"
+                coub.audio_link = f"http://127.0.0.1:{PORT}/a{i}"
+                coub.video_size = coub.audio_size = STREAM_SIZE
+                # Unknown suffixes skip the stream checks, the payload is random
+                coub.video_file = folder / f"c{i}.video"
+                coub.audio_file = folder / f"c{i}.audio"
+                coub.merged_file = folder / f"c{i}.mkv"
+                coubs.append(coub)
+
+            tasks = asyncio.gather(*[download(c) for c in coubs])
+            buffered = await asyncio.wait_for(tasks, TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"FAIL: downloads didn't finish within {TIMEOUT}s")
+        return 1
+    finally:
+        await runner.cleanup()
+
+    if budget.transfer.used:
+        print(f"FAIL: {budget.transfer.used} bytes of the transfer budget weren't released")
+        return 1
+    if not any(buffered):
+        print("FAIL: no coub kept its audio in memory")
+        return 1
+
+    print(f"ok: {COUBS} coubs, {sum(buffered)} with audio in memory")
+    return 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory(prefix="gyre-budget-") as folder:
+        folder = pathlib.Path(folder)
+        use_test_settings(folder)
+        sys.path.insert(0, str(ROOT))
+        sys.exit(asyncio.run(main(folder)))
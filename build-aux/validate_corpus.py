@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Checks gyre.validate against a synthetic corpus of valid and broken streams
+Both the file-based and the streaming check have to match the expected result,
+the latter also if the size reported by the API is wrong
+With --timing it also compares the time per file against FFmpeg (if available)
+"""
+
+import os
+import pathlib
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from gyre import validate  # noqa: E402
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def box(kind, payload):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def full_box(kind, payload):
+    # Version/flags are always 0
+    return box(kind, bytes(4) + payload)
+
+
+def make_mp4(valid_nal=True, handler=b"vide", co64=False, moov_last=False):
+    sps = b"\x67" + os.urandom(10)
+    slice_type = b"\x65" if valid_nal else b"\xe5"
+    idr = slice_type + os.urandom(300)
+    sample = struct.pack(">I", len(sps)) + sps + struct.pack(">I", len(idr)) + idr
+    ftyp = box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2avc1mp41")
+    mdat = box(b"mdat", sample + os.urandom(5000))
+
+    def build_moov(offset):
+        avcc = box(b"avcC", bytes([1, 0x64, 0, 0x1f, 0xff]) + b"\xe1\x00\x00")
+        stsd = full_box(b"stsd", struct.pack(">I", 1) + box(b"avc1", bytes(78) + avcc))
+        stsz = full_box(b"stsz", struct.pack(">II", 0, 1) + struct.pack(">I", len(sample)))
+        if co64:
+            chunks = full_box(b"co64", struct.pack(">IQ", 1, offset))
+        else:
+            chunks = full_box(b"stco", struct.pack(">II", 1, offset))
+        minf = box(b"minf", box(b"vmhd", bytes(12)) + box(b"stbl", stsd + stsz + chunks))
+        hdlr = full_box(b"hdlr", bytes(4) + handler + bytes(13))
+        mdia = box(b"mdia", full_box(b"mdhd", bytes(20)) + hdlr + minf)
+        trak = box(b"trak", full_box(b"tkhd", bytes(80)) + mdia)
+        return box(b"moov", full_box(b"mvhd", bytes(96)) + trak)
+
+    if moov_last:
+        return ftyp + mdat + build_moov(len(ftyp) + 8)
+
+    moov_size = len(build_moov(0))
+    return ftyp + build_moov(len(ftyp) + moov_size + 8) + mdat
+
+
+def make_mp3(frames=60, id3=True, broken_frame=None, junk=0, id3v1=False):
+    data = b""
+    if id3:
+        data += b"ID3\x03\x00\x00" + bytes([0, 0, 0, 20]) + bytes(20)
+    # Zero padding never contains a frame sync
+    data += bytes(junk)
+    for i in range(frames):
+        # MPEG-1 layer III, 128 kbit/s, 44.1 kHz, no padding -> 417 bytes
+        frame = bytes([0xFF, 0xFB, 0x90, 0x64]) + os.urandom(413)
+        if i == broken_frame:
+            frame = b"\x00\x11" + frame[2:]
+        data += frame
+    if id3v1:
+        data += b"TAG" + bytes(125)
+
+    return data
+
+
+def get_corpus():
+    old_storage = bytearray(make_mp4())
+    old_storage[:2] = b"\x1a\x45"
+
+    # name: (content, expected check_file result)
+    return {
+        "valid.mp4": (make_mp4(), True),
+        "valid_co64.mp4": (make_mp4(co64=True), True),
+        "audio_track.mp4": (make_mp4(handler=b"soun"), True),
+        "moov_last.mp4": (make_mp4(moov_last=True), True),
+        "invalid_nal.mp4": (make_mp4(valid_nal=False), False),
+        "truncated.mp4": (make_mp4()[:300], False),
+        "old_storage.mp4": (bytes(old_storage), False),
+        "valid.mp3": (make_mp3(), True),
+        "no_id3.mp3": (make_mp3(id3=False), True),
+        "id3v1.mp3": (make_mp3(frames=3, id3v1=True), True),
+        "short.mp3": (make_mp3(frames=3), True),
+        "late_damage.mp3": (make_mp3(broken_frame=50), True),
+        "broken_frame.mp3": (make_mp3(broken_frame=5), False),
+        "leading_junk.mp3": (make_mp3(junk=5000), None),
+        "no_frames.mp3": (bytes(20000), None),
+    }
+
+
+def check_streaming(path, data, size):
+    check = validate.get_stream_check(path, size)
+    try:
+        offset = 0
+        while offset < len(data):
+            size = random.randint(1, 64*1024)
+            check.feed(data[offset:offset+size])
+            offset += size
+        verified = check.finish()
+    except validate.CorruptedError:
+        return False
+
+    # Unverified streams get the file-based check after the download
+    return True if verified else validate.check_file(path)
+
+
+def time_check(func, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+
+    return (time.perf_counter() - start)/runs
+
+
+def main():
+    timing = "--timing" in sys.argv
+    folder = pathlib.Path(tempfile.mkdtemp(prefix="gyre-corpus-"))
+    failed = False
+
+    try:
+        for name, (data, expected) in get_corpus().items():
+            path = folder / name
+            path.write_bytes(data)
+
+            result = validate.check_file(path)
+            streamed = check_streaming(path, data, len(data))
+            # A wrong size from the API alone must not condemn a stream
+            wrong_size = check_streaming(path, data, len(data) - 100)
+            ok = result == expected and streamed == expected and wrong_size == expected
+            failed |= not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}: expected {expected}, file {result}, "
+                  f"streaming {streamed}, wrong size {wrong_size}")
+
+        if timing:
+            print()
+            ffmpeg = shutil.which("ffmpeg")
+            for name in ["valid.mp4", "valid.mp3"]:
+                path = folder / name
+                python = time_check(lambda: validate.check_file(path), 1000)
+                line = f"{name}: Python {python*1000:.3f} ms"
+                if ffmpeg:
+                    command = [ffmpeg, "-v", "error", "-i", str(path), "-t", "1", "-f", "null", "-"]
+                    run = lambda: subprocess.run(command, capture_output=True, check=False)
+                    line += f", FFmpeg {time_check(run, 20)*1000:.1f} ms"
+                print(line)
+    finally:
+        shutil.rmtree(folder)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
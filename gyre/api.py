@@ -0,0 +1,111 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from collections import OrderedDict
+import json
+import time
+
+from gyre import concurrency, httpcache, limiter
+from gyre.concurrency import is_congestion_status
+from gyre.utils import cancellable, write_stats_log
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# How long (in seconds) a response is handed to identical requests after it finished
+SHARE_TTL = 10
+
+# Requests currently in flight by URL
+inflight = {}
+# Recently finished responses by URL, oldest first
+recent = OrderedDict()
+# Requests answered by another identical request since the last summary
+saved = 0
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+@cancellable
+async def fetch_json(url, session):
+    # All requests to the Coub API go through here
+    # Identical requests share one response (e.g. page 1 for the page count and its IDs)
+    # Responses are shared as is, so callers must not modify them
+    global saved
+
+    now = time.monotonic()
+    while recent and now - next(iter(recent.values()))[0] >= SHARE_TTL:
+        recent.popitem(last=False)
+    if url in recent:
+        saved += 1
+        return recent[url][1]
+
+    if url in inflight:
+        saved += 1
+        return await asyncio.shield(inflight[url])
+
+    task = asyncio.ensure_future(_fetch_json(url, session))
+    inflight[url] = task
+    try:
+        # Others might still wait for the response, even if this caller gets cancelled
+        api_json = await asyncio.shield(task)
+    finally:
+        if inflight.get(url) is task:
+            del inflight[url]
+
+    recent.pop(url, None)
+    recent[url] = (time.monotonic(), api_json)
+
+    return api_json
+
+
+@cancellable
+async def _fetch_json(url, session):
+    cache = httpcache.cache
+    entry = await cache.get(url) if cache else None
+    headers = cache.get_headers(entry) if entry else {}
+
+    async with concurrency.api.slot() as slot:
+        async with session.get(url, headers=headers) as response:
+            slot.record(response)
+            # Other error responses still carry a JSON body with details
+            if is_congestion_status(response.status):
+                response.raise_for_status()
+
+            if entry and response.status == 304:
+                await cache.hit(url)
+                return json.loads(entry["body"])
+
+            content = await response.read()
+            if cache and response.status == 200:
+                await cache.store(url, response.headers, content)
+
+    await limiter.api.consume(len(content))
+
+    return json.loads(content)
+
+
+def log_summary():
+    global saved
+
+    if saved:
+        write_stats_log(f"Shared responses for {saved} duplicate API requests")
+
+    saved = 0
+    recent.clear()
@@ -17,11 +17,9 @@
 
 import asyncio
 import pathlib
-import time
 import traceback
 import urllib
 
-import aiohttp
 import gi
 
 gi.require_version("Gtk", "3.0")
@@ -30,20 +28,28 @@ gi.require_version("Notify", "0.7")
 
 from gi.repository import Gtk, Gio, Handy, GLib, GObject, Notify
 
+from gyre import api
+from gyre import budget
 from gyre import checker
+from gyre import concurrency
+from gyre import contentstore
+from gyre import ffmpeg
+from gyre import httpcache
+from gyre import limiter
+from gyre import metadata
+from gyre import network
+from gyre import retry
+from gyre import stages
+from gyre import staging
 from gyre import utils
+from gyre import watermark
+from gyre import workers
 from gyre.interface import dialogs
 from gyre.interface.add import AddURLWindow, AddWindow
 from gyre.interface.window import GyreWindow
 from gyre.interface.preferences import PreferenceWindow
 from gyre.settings import Settings
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Global variables
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-SLEEP_TIMEOUT = 0.5
-
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Classes
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -104,6 +110,7 @@ class Application(Gtk.Application):
         Gtk.Application.do_startup(self)
         Handy.init()
         Notify.init("Gyre")
+        limiter.init()
 
     def do_activate(self):
         if not self.window:
@@ -261,34 +268,63 @@ class Application(Gtk.Application):
 
     @staticmethod
     def _clean_up():
-        for p in pathlib.Path(Settings.get_default().output_path).glob("*.gyre"):
-            p.unlink()
+        # Partial downloads get continued during the next run
+        if Settings.get_default().resume_downloads:
+            return
+
+        folders = [pathlib.Path(Settings.get_default().output_path)]
+        if staging.get_path():
+            folders.append(staging.get_path())
+        for folder in folders:
+            utils.remove_partials(folder)
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Functions
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-@utils.cancellable
-def wait():
-    time.sleep(SLEEP_TIMEOUT)
-
-
 async def process(model):
     try:
+        httpcache.init()
+        contentstore.init()
+        metadata.init()
+        watermark.init()
+        network.init()
+        # Partials of coubs, which didn't come up again for a long time
+        utils.remove_partials(pathlib.Path(Settings.get_default().output_path), stale_only=True)
         while True:
             checker.init()
-
-            tout = aiohttp.ClientTimeout(total=None)
-            conn = aiohttp.TCPConnector(limit=Settings.get_default().connections)
-            async with aiohttp.ClientSession(timeout=tout, connector=conn) as session:
+            concurrency.init()
+            budget.init()
+            stages.init()
+            ffmpeg.init()
+            staging.init()
+
+            # The session survives repeated downloads, so DNS lookups and connections are reused
+            session = await network.manager.get()
+            network.manager.warm_up()
+            workers.init(session)
+            try:
                 tasks = [item.process(session) for item in model]
                 await asyncio.gather(*tasks)
+            finally:
+                await workers.uninit()
+                await network.manager.finish_run()
 
             checker.uninit()
+            concurrency.uninit()
+            budget.uninit()
+            retry.log_summary()
+            api.log_summary()
+            httpcache.log_summary()
+            contentstore.log_summary()
+            stages.log_summary()
+            stages.uninit()
+            ffmpeg.uninit()
+            staging.uninit()
+            await metadata.save()
 
             if Settings.get_default().repeat_download:
-                for _ in range(int(Settings.get_default().repeat_interval*60/SLEEP_TIMEOUT)):
-                    wait()
+                await utils.sleep(Settings.get_default().repeat_interval*60)
             else:
                 break
 
@@ -310,3 +346,13 @@ async def process(model):
         GLib.idle_add(utils.notify_error)
     finally:
         checker.uninit()
+        concurrency.uninit()
+        budget.uninit()
+        stages.uninit()
+        ffmpeg.uninit()
+        staging.uninit()
+        httpcache.uninit()
+        contentstore.uninit()
+        await metadata.uninit()
+        watermark.uninit()
+        await network.uninit()
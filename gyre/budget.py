@@ -0,0 +1,124 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from contextlib import asynccontextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from gyre.settings import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# File descriptors left for everything else (GTK, logs, FFmpeg, ...)
+RESERVED_FILES = 64
+# Used if the process limit can't be determined (e.g. Windows' C runtime default)
+DEFAULT_FILE_LIMIT = 512
+# Every transfer needs a socket and the file it writes to
+FILES_PER_TRANSFER = 2
+
+# Bytes of all running transfers
+transfer = None
+# Open file descriptors of all running transfers
+files = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Budget:
+    """
+    Shared budget, which tasks draw from while they run
+    A single request larger than the budget is allowed as long as it runs alone
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._waiters = []
+
+    async def acquire(self, amount):
+        while self.used and self.used + amount > self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+        self.used += amount
+
+    def try_acquire(self, amount):
+        # Returns whether the amount was taken right away, never waits
+        if self.used + amount > self.limit:
+            return False
+
+        self.used += amount
+        return True
+
+    def release(self, amount):
+        self.used -= amount
+
+        # Everyone checks again whether they fit now
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def hold(self, amount):
+        await self.acquire(amount)
+        try:
+            yield
+        finally:
+            self.release(amount)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def get_file_limit():
+    if resource is None:
+        return DEFAULT_FILE_LIMIT
+
+    limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if limit == resource.RLIM_INFINITY:
+        return DEFAULT_FILE_LIMIT*8
+
+    return max(limit - RESERVED_FILES, FILES_PER_TRANSFER)
+
+
+def init():
+    global transfer, files
+
+    # Size is stored in MiB
+    transfer = Budget(Settings.get_default().transfer_size_limit*1024*1024)
+    files = Budget(get_file_limit())
+
+
+def uninit():
+    global transfer, files
+
+    transfer = None
+    files = None
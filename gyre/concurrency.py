@@ -0,0 +1,179 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from collections import deque
+import time
+
+from aiohttp import ClientConnectionError
+from gi.repository import GObject
+
+from gyre.settings import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Window to start with, before any feedback is available
+INITIAL_WINDOW = 4
+# Multiplicative decrease on resets, 429 and 5xx responses
+BACKOFF_FACTOR = 0.5
+# Ignore further congestion signals for this long after backing off
+# Otherwise a single hiccup, which hits many requests at once, collapses the window
+BACKOFF_COOLDOWN = 1
+# Requests slower than this multiple of the fastest one don't grow the window
+LATENCY_TOLERANCE = 2
+# Lets the latency baseline drift upwards, so one lucky request doesn't stall growth forever
+BASELINE_DRIFT = 1.01
+
+# API and CDN servers congest independently, so each gets its own window
+api = None
+cdn = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class ConcurrencyController(GObject.GObject):
+    """
+    AIMD controller for the number of in-flight requests
+    Grows the window while requests are fast and successful and halves it on congestion
+    """
+
+    window = GObject.Property(type=int, default=1)
+    in_flight = GObject.Property(type=int, default=0)
+
+    def __init__(self, ceiling):
+        super().__init__()
+        self.ceiling = max(1, ceiling)
+        self.size = float(min(INITIAL_WINDOW, self.ceiling))
+        self.window = int(self.size)
+
+        self.baseline = None
+        self.last_backoff = 0
+        self._waiters = deque()
+
+    def slot(self):
+        return RequestSlot(self)
+
+    async def acquire(self):
+        while self.in_flight >= self.window:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                # Pass the wake-up on, if we got one
+                self._wake()
+                raise
+
+        self.in_flight += 1
+
+    def release(self, latency=None, congested=False):
+        self.in_flight -= 1
+
+        if congested:
+            self._decrease()
+        elif latency is not None:
+            self._increase(latency)
+
+        self._wake()
+
+    def _increase(self, latency):
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline *= BASELINE_DRIFT
+
+        if latency > self.baseline*LATENCY_TOLERANCE:
+            return
+
+        # Roughly +1 per window worth of healthy requests
+        self.size = min(self.size + 1/self.size, self.ceiling)
+        self._set_window()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self.last_backoff < BACKOFF_COOLDOWN:
+            return
+
+        self.last_backoff = now
+        self.size = max(self.size*BACKOFF_FACTOR, 1)
+        self._set_window()
+
+    def _set_window(self):
+        if int(self.size) != self.window:
+            self.window = int(self.size)
+
+    def _wake(self):
+        free = self.window - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class RequestSlot:
+    """
+    Holds one slot of the controller for the duration of a request
+    Call record() as soon as the response headers arrived
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.start = None
+        self.latency = None
+        self.congested = False
+
+    async def __aenter__(self):
+        await self.controller.acquire()
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type and issubclass(exc_type, (ClientConnectionError, asyncio.TimeoutError)):
+            self.congested = True
+        self.controller.release(self.latency, self.congested)
+
+    def record(self, response):
+        self.latency = time.monotonic() - self.start
+        self.congested = is_congestion_status(response.status)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def is_congestion_status(status):
+    return status == 429 or status >= 500
+
+
+def init():
+    global api, cdn
+
+    # The connection setting is only the upper limit now
+    api = ConcurrencyController(Settings.get_default().connections)
+    cdn = ConcurrencyController(Settings.get_default().connections)
+
+
+def uninit():
+    global api, cdn
+
+    api = None
+    cdn = None
@@ -16,10 +16,12 @@
 # along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
+from collections import deque
 import json
 import math
 import pathlib
 import re
+import time
 from urllib.parse import quote as urlquote
 from urllib.parse import unquote as urlunquote
 
@@ -27,7 +29,11 @@ from aiohttp import ClientError
 from gi.repository import GObject
 
 from gyre import checker
-from gyre.coub import Coub
+from gyre import metadata
+from gyre import watermark
+from gyre import workers
+from gyre.api import fetch_json
+from gyre.retry import RetryPolicy
 from gyre.utils import cancellable, write_error_log
 from gyre.settings import Settings
 
@@ -35,9 +41,14 @@ from gyre.settings import Settings
 # Global variables
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# A hard limit on how many Coubs to process at once
-# Prevents excessive RAM usage for very large downloads
-COUB_LIMIT = 1000
+# How many pages to request ahead of the download
+PAGE_PREFETCH = 4
+
+# Byte counters are published at most once per interval (in seconds)
+# Otherwise every chunk would trigger a UI update
+RATE_INTERVAL = 1
+# Weight of the latest interval in the smoothed transfer rate
+RATE_SMOOTHING = 0.3
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Classes
@@ -58,21 +69,45 @@ class BaseContainer(GObject.GObject):
     quantity = None
 
     # Attempts are done on a per-page level, but the attempt limit is for all pages
-    attempt = 0
+    retry_policy = None
 
     page_progress = GObject.Property(type=int, default=0)
     done = GObject.Property(type=int, default=0)
     count = GObject.Property(type=int, default=0)
+    # Stream sizes (in bytes) of all coubs whose infos are known
+    total_bytes = GObject.Property(type=GObject.TYPE_INT64, default=0)
+    done_bytes = GObject.Property(type=GObject.TYPE_INT64, default=0)
+    # Transfer rate (in bytes/s) and number of streams currently downloading
+    rate = GObject.Property(type=float, default=0)
+    streams = GObject.Property(type=int, default=0)
 
     complete = GObject.Property(type=bool, default=False)
     error = GObject.Property(type=bool, default=False)
     error_msg = None
 
+    # How download items share the workers
+    priority = GObject.Property(type=str, default="Normal")
+    pinned = GObject.Property(type=bool, default=False)
+
     pages = 0
     invalid = 0
     exist = 0
+    # Coubs included in total_bytes
+    sized = 0
+    started = None
+    # Bytes received since the last published update
+    new_bytes = 0
+    updated = None
+    # Bytes taken from the content store, they count as progress but not as transfer
+    reused_bytes = 0
+
+    # Newest creation date seen during the current download
+    newest = None
 
     PER_PAGE = 25
+    # Sorts that list coubs from newest to oldest
+    # These allow to stop fetching pages as soon as known coubs show up
+    NEWEST_SORTS = ()
 
     def __init__(self, id, sort, quantity):
         super().__init__()
@@ -88,70 +123,162 @@ class BaseContainer(GObject.GObject):
     @cancellable
     async def _fetch_page_count(self, request, session):
         try:
-            async with session.get(request) as response:
-                api_json = json.loads(await response.read())
-                if api_json.get("error") is not None:
-                    raise ContainerUnavailableError from None
-                self.pages = api_json.get("total_pages")
+            api_json = await fetch_json(request, session)
+            if api_json.get("error") is not None:
+                raise ContainerUnavailableError from None
+            self.pages = api_json.get("total_pages")
         except (ClientError, json.decoder.JSONDecodeError):
             raise APIResponseError from None
 
     @cancellable
-    async def _fetch_api_json(self, request, session):
-        try:
-            async with session.get(request) as response:
-                api_json = await response.read()
-                api_json = json.loads(api_json)
-        except (ClientError, json.decoder.JSONDecodeError):
-            api_json = None
-
-        return api_json
-
-    @cancellable
-    async def _fetch_page_ids(self, request, session):
-        retries = Settings.get_default().retry_attempts
-        while retries < 0 or self.attempt <= retries:
-            api_json = await self._fetch_api_json(request, session)
-            if api_json:
+    async def _fetch_page(self, request, session):
+        while True:
+            try:
+                api_json = await fetch_json(request, session)
                 break
-            self.attempt += 1
+            except (ClientError, json.decoder.JSONDecodeError) as error:
+                if not await self.retry_policy.backoff(error):
+                    raise APIResponseError from None
 
-        if not api_json:
-            raise APIResponseError from None
+        coubs = api_json["coubs"]
+        for coub in coubs:
+            if coub.get("created_at") and (not self.newest or coub["created_at"] > self.newest):
+                self.newest = coub["created_at"]
+
+        self.page_progress += 1
+        return coubs
 
+    def _get_page_ids(self, coubs):
+        # Pages contain the same coub infos as the coub API, so they're passed on
+        # to avoid another request per coub
         ids = []
-        for coub in api_json["coubs"]:
+        for coub in coubs:
             if coub["recoub_to"]:
-                c_id = coub["recoub_to"]["permalink"]
-            else:
-                c_id = coub["permalink"]
+                coub = coub["recoub_to"]
+            c_id = coub["permalink"]
 
             if not (checker.in_archive(c_id) or checker.in_session(c_id)):
-                ids.append(c_id)
+                ids.append((c_id, coub if metadata.is_complete(coub) else None))
 
-        self.page_progress += 1
         return ids
 
     @cancellable
-    async def _get_ids(self, session):
+    async def _fetch_page_ids(self, request, session):
+        coubs = await self._fetch_page(request, session)
+        return self._get_page_ids(coubs)
+
+    def _incremental(self):
+        return Settings.get_default().repeat_download and self.sort in self.NEWEST_SORTS
+
+    async def _iter_ids(self, session):
+        # Yields the new IDs page by page, so downloads can start with the first page
         base_request = self._get_template()
-        await self._fetch_page_count(base_request, session)
+        # Same request as the first page, so the response gets reused
+        await self._fetch_page_count(f"{base_request}&page=1", session)
 
         if self.quantity:
             max_pages = math.ceil(self.quantity/self.PER_PAGE)
             if self.pages > max_pages:
                 self.pages = max_pages
 
-        requests = [f"{base_request}&page={p}" for p in range(1, self.pages+1)]
-        tasks = [self._fetch_page_ids(r, session) for r in requests]
-        ids = await asyncio.gather(*tasks)
-        ids = [i for page in ids for i in page]
+        mark = watermark.get(base_request) if self._incremental() else None
+        if mark:
+            pages = self._iter_new_page_ids(base_request, mark, session)
+        else:
+            pages = self._iter_page_ids(base_request, session)
 
-        if self.quantity:
-            return ids[:self.quantity]
-        return ids
+        remaining = self.quantity
+        try:
+            async for ids in pages:
+                if self.quantity:
+                    ids = ids[:remaining]
+                    remaining -= len(ids)
+                yield ids
+                if self.quantity and not remaining:
+                    return
+        finally:
+            await pages.aclose()
+
+    async def _iter_page_ids(self, base_request, session):
+        # Keep a few pages in flight, but hand them out in order
+        pending = deque()
+        try:
+            for p in range(1, self.pages+1):
+                request = f"{base_request}&page={p}"
+                pending.append(asyncio.ensure_future(self._fetch_page_ids(request, session)))
+                if len(pending) >= PAGE_PREFETCH:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _iter_new_page_ids(self, base_request, mark, session):
+        # Pages are sorted by creation date, so everything after the watermark is already known
+        for p in range(1, self.pages+1):
+            coubs = await self._fetch_page(f"{base_request}&page={p}", session)
+            new = [c for c in coubs if c["created_at"] > mark]
+            yield self._get_page_ids(new)
+            if len(new) < len(coubs):
+                break
+
+        # Skipped pages count as parsed
+        self.page_progress = self.pages
+
+    def get_weight(self):
+        # Share of the workers and stage slots relative to other containers
+        return workers.PRIORITY_WEIGHTS.get(self.priority, workers.PRIORITY_WEIGHTS["Normal"])
+
+    def add_size(self, size):
+        self.sized += 1
+        self.total_bytes += size
+
+    def add_bytes(self, amount, reused=False):
+        if reused:
+            self.reused_bytes += amount
+            self.done_bytes += amount
+            return
+
+        self.new_bytes += amount
+
+        now = time.monotonic()
+        elapsed = now - self.updated
+        if elapsed < RATE_INTERVAL:
+            return
+
+        current = self.new_bytes/elapsed
+        self.rate = current if not self.rate else RATE_SMOOTHING*current + (1-RATE_SMOOTHING)*self.rate
+        self.done_bytes += self.new_bytes
+        self.new_bytes = 0
+        self.updated = now
+
+    def get_average_rate(self):
+        return (self.done_bytes - self.reused_bytes)/(time.monotonic() - self.started)
+
+    def get_eta(self):
+        # Seconds left, extrapolated from the average coub size and the download rate so far
+        if not (self.done_bytes and self.sized):
+            return None
+
+        rate = self.get_average_rate()
+        if not rate:
+            return None
+        unsized = max(self.count - self.sized - self.exist - self.invalid, 0)
+        remaining = self.total_bytes + unsized*self.total_bytes/self.sized - self.done_bytes
+
+        return max(remaining, 0)/rate
+
+    def _update_watermark(self):
+        # Coubs that failed should be tried again next time
+        # Every coub that gave up counts as invalid, so the watermark never skips past one
+        if self._incremental() and not self.invalid:
+            watermark.update(self._get_template(), self.newest)
 
     def _reset(self):
+        self.retry_policy = RetryPolicy()
+        self.newest = None
         self.complete = False
         self.error = False
         self.page_progress = 0
@@ -160,29 +287,64 @@ class BaseContainer(GObject.GObject):
         self.done = 0
         self.invalid = 0
         self.exist = 0
+        self.total_bytes = 0
+        self.done_bytes = 0
+        self.sized = 0
+        self.rate = 0
+        self.streams = 0
+        self.new_bytes = 0
+        self.reused_bytes = 0
+        self.started = time.monotonic()
+        self.updated = self.started
+
+    async def _submit_ids(self, session):
+        ids = self._iter_ids(session)
+        try:
+            async for page in ids:
+                self.count += len(page)
+                for c_id, page_json in page:
+                    await workers.pool.submit(self, c_id, page_json)
+        finally:
+            await ids.aclose()
+            # Coubs already handed to the pool finish even if a later page failed
+            await workers.pool.join(self)
+
+    async def _tick_rate(self):
+        # Without new data the rate would never drop while streams stall
+        while True:
+            await asyncio.sleep(RATE_INTERVAL)
+            self.add_bytes(0)
+
+    def _flush_bytes(self):
+        # Bytes of the last interval would otherwise never show up
+        self.done_bytes += self.new_bytes
+        self.new_bytes = 0
+        self.rate = 0
 
     @cancellable
     async def process(self, session):
         self._reset()
+        ticker = asyncio.ensure_future(self._tick_rate())
 
         try:
-            ids = await self._get_ids(session)
-            self.count = len(ids)
-
             if Settings.get_default().output_list:
+                ids = []
+                async for page in self._iter_ids(session):
+                    ids.extend(c_id for c_id, _ in page)
+                self.count = len(ids)
+
                 links = [f"https://coub.com/view/{i}" for i in ids]
                 with pathlib.Path(Settings.get_default().output_list_path).open("a") as f:
                     print(*links, sep="\n", file=f)#
+                self._update_watermark()
                 self.complete = True
                 return
 
-            coubs = [Coub(i, self, session) for i in ids]
-
-            while coubs:
-                tasks = [c.process() for c in coubs[:COUB_LIMIT]]
-                await asyncio.gather(*tasks)
-                coubs = coubs[COUB_LIMIT:]
+            # Pages are fetched while the first coubs already download
+            # The shared worker pool limits how many coubs are in flight across all containers
+            await self._submit_ids(session)
 
+            self._update_watermark()
             self.complete = True
         except ContainerUnavailableError:
             self.error = True
@@ -200,6 +362,9 @@ class BaseContainer(GObject.GObject):
             self.error = True
             self.error_msg = "Error: Invalid list file!"
             write_error_log(f"{self.id} can't be read")
+        finally:
+            ticker.cancel()
+            self._flush_bytes()
 
 
 class SingleCoub(BaseContainer):
@@ -209,8 +374,7 @@ class SingleCoub(BaseContainer):
         super().__init__(id, sort, quantity)
 
     # async is unnecessary here, but avoids the need for special treatment
-    @cancellable
-    async def _get_ids(self, session):
+    async def _iter_ids(self, session):
         # Only here to test if coub exists
         await self._fetch_page_count(f"https://coub.com/api/v2/coubs/{self.id}", session)
 
@@ -218,7 +382,7 @@ class SingleCoub(BaseContainer):
         if not (checker.in_archive(self.id) or checker.in_session(self.id)):
             ids.append(self.id)
 
-        return [self.id]
+        yield [(self.id, None)]
 
 
 class LinkList(BaseContainer):
@@ -234,23 +398,24 @@ class LinkList(BaseContainer):
         with self.list.open("r") as f:
             _ = f.read(1)
 
-    @cancellable
-    async def _get_ids(self, session):
+    async def _iter_ids(self, session):
         self._valid_list_file()
 
         ids = self.list.read_text().strip()
         ids = re.split(r"\s+", ids)
         ids = [i for i in ids if i.startswith("https://coub.com/view/")]
         ids = [i.replace("https://coub.com/view/", "") for i in ids]
-        ids = [i for i in ids if not (checker.in_archive(i) or checker.in_session(i))]
+        ids = [(i, None) for i in ids if not (checker.in_archive(i) or checker.in_session(i))]
 
         if self.quantity:
-            return ids[:self.quantity]
-        return ids
+            yield ids[:self.quantity]
+        else:
+            yield ids
 
 
 class Channel(BaseContainer):
     type = "Channel"
+    NEWEST_SORTS = ("Most Recent",)
 
     def __init__(self, id, sort="Most Recent", quantity=0):
         super().__init__(id, sort, quantity)
@@ -279,6 +444,7 @@ class Channel(BaseContainer):
 
 class Tag(BaseContainer):
     type = "Tag"
+    NEWEST_SORTS = ("Fresh",)
 
     def __init__(self, id, sort="Popular", quantity=0):
         super().__init__(id, sort, quantity)
@@ -307,6 +473,7 @@ class Tag(BaseContainer):
 
 class Search(BaseContainer):
     type = "Search"
+    NEWEST_SORTS = ("Most Recent",)
 
     def __init__(self, id, sort="Relevance", quantity=0):
         super().__init__(id, sort, quantity)
@@ -330,6 +497,7 @@ class Search(BaseContainer):
 
 class Community(BaseContainer):
     type = "Community"
+    NEWEST_SORTS = ("Fresh",)
 
     def __init__(self, id, sort="Hot (Monthly)", quantity=0):
         super().__init__(id, sort, quantity)
@@ -430,6 +598,7 @@ class Story(BaseContainer):
 
 class HotSection(BaseContainer):
     type = "Hot Section"
+    NEWEST_SORTS = ("Fresh",)
 
     def __init__(self, id="", sort="Hot (Monthly)", quantity=0):
         super().__init__(id, sort, quantity)
@@ -517,7 +686,7 @@ class Best(BaseContainer):
 # Functions
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def create_container(type, id, sort, quantity):
+def create_container(type, id, sort, quantity, priority="Normal", pinned=False):
     args = {}
     if id:
         args["id"] = id
@@ -527,26 +696,33 @@ def create_container(type, id, sort, quantity):
         args["quantity"] = quantity
 
     if type == "Coub":
-        return SingleCoub(**args)
-    if type == "List":
-        return LinkList(**args)
-    if type == "Channel":
-        return Channel(**args)
-    if type == "Tag":
-        return Tag(**args)
-    if type == "Search":
-        return Search(**args)
-    if type == "Community":
-        return Community(**args)
-    if type == "Featured":
-        return Featured(**args)
-    if type == "Coub of the Day":
-        return CoubOfTheDay(**args)
-    if type == "Story":
-        return Story(**args)
-    if type == "Hot Section":
-        return HotSection(**args)
-    if type == "Random":
-        return Random(**args)
-    if type == "Best":
-        return Best(**args)
+        container = SingleCoub(**args)
+    elif type == "List":
+        container = LinkList(**args)
+    elif type == "Channel":
+        container = Channel(**args)
+    elif type == "Tag":
+        container = Tag(**args)
+    elif type == "Search":
+        container = Search(**args)
+    elif type == "Community":
+        container = Community(**args)
+    elif type == "Featured":
+        container = Featured(**args)
+    elif type == "Coub of the Day":
+        container = CoubOfTheDay(**args)
+    elif type == "Story":
+        container = Story(**args)
+    elif type == "Hot Section":
+        container = HotSection(**args)
+    elif type == "Random":
+        container = Random(**args)
+    elif type == "Best":
+        container = Best(**args)
+    else:
+        return None
+
+    container.priority = priority
+    container.pinned = pinned
+
+    return container
@@ -0,0 +1,199 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import shutil
+import time
+
+from gyre.settings import Settings
+from gyre.utils import evict_oldest, get_cache_dir, run_blocking, write_stats_log
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+store = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class ContentStore:
+    """
+    On-disk store for finished streams, keyed by their CDN link and size
+    Streams only get added as hardlinks, so storing them never costs an extra copy
+    Entries are evicted oldest first (by download time), or once they exceed the max. age
+    """
+
+    def __init__(self, path, max_size, max_age):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.saved = 0
+        self.evicting = False
+
+        if not self.path.exists():
+            self.path.mkdir()
+        self.size = 0
+        self._expire()
+
+    def _get_file(self, url, size):
+        return self.path / hashlib.sha1(f"{url} {size}".encode()).hexdigest()
+
+    def _get_entry(self, url, size):
+        # Streams without a known size could have changed behind the same link
+        if not size:
+            return None
+
+        entry = self._get_file(url, size)
+        try:
+            if entry.stat().st_size != size:
+                return None
+        except OSError:
+            return None
+
+        return entry
+
+    def _hit(self, size):
+        self.hits += 1
+        self.saved += size
+
+    def _fetch(self, url, size, target):
+        entry = self._get_entry(url, size)
+        if not entry:
+            return False
+
+        try:
+            target.unlink(missing_ok=True)
+            link_or_copy(entry, target)
+        except OSError:
+            return False
+
+        return True
+
+    async def fetch(self, url, size, target):
+        # Returns True if the stream was placed at target
+        placed = await run_blocking(self._fetch, url, size, target)
+        if placed:
+            self._hit(size)
+
+        return placed
+
+    def _read(self, url, size):
+        entry = self._get_entry(url, size)
+        if not entry:
+            return None
+
+        try:
+            return entry.read_bytes()
+        except OSError:
+            return None
+
+    async def read(self, url, size):
+        # Returns None if the stream isn't stored
+        data = await run_blocking(self._read, url, size)
+        if data is not None:
+            self._hit(size)
+
+        return data
+
+    def _add(self, url, size, path):
+        if not size or self._get_entry(url, size):
+            return False
+
+        entry = self._get_file(url, size)
+        temp_file = entry.with_name(f"{entry.name}.tmp")
+        try:
+            temp_file.unlink(missing_ok=True)
+            # Copying would cost as much disk bandwidth as the download saved in the first place
+            os.link(path, temp_file)
+            if temp_file.stat().st_size != size:
+                temp_file.unlink()
+                return False
+            temp_file.replace(entry)
+        except OSError:
+            temp_file.unlink(missing_ok=True)
+            return False
+
+        return True
+
+    async def add(self, url, size, path):
+        if not await run_blocking(self._add, url, size, path):
+            return
+        self.size += size
+
+        # Entries added in the meantime get covered by the next eviction
+        if self.size > self.max_size and not self.evicting:
+            self.evicting = True
+            try:
+                self.size -= await run_blocking(evict_oldest, self.path, self.size, self.max_size)
+            finally:
+                self.evicting = False
+
+    def _expire(self):
+        # Also removes leftovers of interrupted additions
+        limit = time.time() - self.max_age
+        for entry in self.path.iterdir():
+            stat = entry.stat()
+            if entry.suffix == ".tmp" or self.max_age and stat.st_mtime < limit:
+                entry.unlink(missing_ok=True)
+            else:
+                self.size += stat.st_size
+
+        if self.size > self.max_size:
+            self.size -= evict_oldest(self.path, self.size, self.max_size)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def link_or_copy(source, target):
+    # Hardlinks fail across file systems or on file systems without support for them
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def log_summary():
+    if store and store.hits:
+        write_stats_log(
+            f"Reused {store.hits} streams from the content store, "
+            f"saved {store.saved/1024/1024:.1f} MiB of downloads"
+        )
+
+    if store:
+        store.hits = 0
+        store.saved = 0
+
+
+def init():
+    global store
+
+    # Size is stored in MiB, 0 disables the store
+    max_size = Settings.get_default().content_store_size*1024*1024
+    # Age is stored in days, 0 keeps entries until they get evicted by size
+    max_age = Settings.get_default().content_store_age*24*60*60
+    store = ContentStore(get_cache_dir() / "streams", max_size, max_age) if max_size else None
+
+
+def uninit():
+    global store
+
+    store = None
@@ -16,16 +16,32 @@
 # along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
+from contextlib import nullcontext
+import io
 import json
+import math
 import pathlib
 import re
-import subprocess
 import unicodedata
 
-from aiohttp import ClientError
+from aiohttp import ClientError, ClientPayloadError, ClientResponseError
 
+from gyre import budget, concurrency, contentstore, ffmpeg, limiter, metadata, network, stages, staging, validate
+from gyre.api import fetch_json
+from gyre.retry import RetryPolicy
 from gyre.settings import Settings
-from gyre.utils import cancellable, write_error_log
+from gyre.utils import CancelledError, cancellable, run_blocking, write_error_log
+from gyre.writer import StreamWriter, get_read_size
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Smallest byte range worth its own connection in segmented downloads
+SEGMENT_SIZE = 1024*1024
+
+# CDN responses hinting at an outdated stream link
+STALE_LINK_STATUS = (403, 404, 410)
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Classes
@@ -47,6 +63,14 @@ class CoubCorruptedError(Exception):
         self.path = path
 
 
+class StreamCorruptedError(ClientPayloadError):
+    # Found during the download, so it gets retried like any other broken response
+
+    def __init__(self, path):
+        super().__init__(f"{path.name} corrupted")
+        self.path = path
+
+
 class Coub:
 
     id = ""
@@ -58,22 +82,40 @@ class Coub:
 
     container = None
     session = None
+    # Coub infos already included in the container's page
+    page_json = None
 
     video = False
     audio = False
 
     video_link = ""
     audio_link = ""
+    # Stream sizes according to the API (0 if unknown)
+    video_size = 0
+    audio_size = 0
+    # Whether the size was already added to the container's total
+    sized = False
 
     video_file = None
     audio_file = None
     merged_file = None
-
-    def __init__(self, id, container, session):
+    # Files that already passed a full check while downloading
+    verified = set()
+    # Audio that's only needed for merging stays in memory
+    audio_data = None
+    # Part of the transfer budget held by audio_data (and the video, while both download)
+    buffered = 0
+    # Where the streams are downloaded to and the space claimed there (None -> output path)
+    staging_area = None
+    staged_size = 0
+
+    def __init__(self, id, container, session, page_json=None):
         super().__init__()
         self.id = id
         self.container = container
         self.session = session
+        self.page_json = page_json
+        self.verified = set()
         # We want to be able to re-download coubs with different settings
         self.video = Settings.get_default().download_video
         self.audio = Settings.get_default().download_audio
@@ -98,17 +140,92 @@ class Coub:
         with pathlib.Path(Settings.get_default().archive_path).open("a") as f:
             print(self.id, file=f)
 
+    def _remove_staged(self):
+        if not self.staging_area:
+            return
+
+        self.staging_area.release(self.staged_size)
+        self.staged_size = 0
+        # Anything still staged didn't make it to the output path
+        # Partial downloads are left to the resume logic
+        if self.audio_file or self.video_file:
+            for path in [self.video_file, self.audio_file]:
+                self._stage(path).unlink(missing_ok=True)
+        self.staging_area = None
+
+    def _drop_audio_data(self):
+        if self.buffered:
+            budget.transfer.release(self.buffered)
+            self.buffered = 0
+        self.audio_data = None
+
     def _clean_up(self):
-        if Settings.get_default().keep_streams:
+        self._drop_audio_data()
+        if self.staging_area:
+            self._remove_staged()
             return
         if not (self.audio_file or self.video_file):
             return
 
+        if Settings.get_default().keep_streams:
+            return
+
         if self.video and self.audio:
             self.audio_file.unlink(missing_ok=True)
             if not self.video_file == self.merged_file:
                 self.video_file.unlink(missing_ok=True)
 
+    def _get_size(self):
+        size = 0
+        if self.video:
+            size += self.video_size or 0
+        if self.audio:
+            size += self.audio_size or 0
+
+        return size
+
+    def _stage(self, path):
+        if not self.staging_area:
+            return path
+
+        return self.staging_area.path / path.name
+
+    def _claim_staging(self):
+        if not staging.area:
+            return
+
+        self.staged_size = staging.area.claim(self._get_size())
+        if self.staged_size:
+            self.staging_area = staging.area
+
+    async def _publish(self):
+        if not self.staging_area:
+            return
+
+        # Merged files are written to the output path right away
+        files = []
+        if not (self.video and self.audio) or Settings.get_default().keep_streams:
+            if self.video:
+                files.append(self.video_file)
+            if self.audio and not self.audio_data:
+                files.append(self.audio_file)
+
+        # Copying from a RAM disk to the output path can take a while
+        for path in files:
+            await run_blocking(staging.publish, self._stage(path), path)
+
+    async def _store_streams(self):
+        # Only streams that passed the integrity check end up in the store
+        # Streams kept in memory have no file to link to
+        store = contentstore.store
+        if not store:
+            return
+
+        if self.video:
+            await store.add(self.video_link, self.video_size, self._stage(self.video_file))
+        if self.audio and not self.audio_data:
+            await store.add(self.audio_link, self.audio_size, self._stage(self.audio_file))
+
     def _finish(self):
         self.container.done += 1
         self._clean_up()
@@ -146,9 +263,10 @@ class Coub:
 
     @cancellable
     async def _fetch_infos(self):
-        async with self.session.get(f"https://coub.com/api/v2/coubs/{self.id}") as response:
-            api_json = await response.read()
-            api_json = json.loads(api_json)
+        api_json = self.page_json or metadata.get(self.id)
+        if api_json is None:
+            api_json = await fetch_json(f"https://coub.com/api/v2/coubs/{self.id}", self.session)
+            metadata.add(self.id, api_json)
 
         video_streams, audio_streams = get_stream_lists(api_json)
         self.video = bool(video_streams) if self.video else self.video
@@ -158,9 +276,9 @@ class Coub:
             raise CoubUnavailableError
 
         if self.video:
-            self.video_link = video_streams[Settings.get_default().video_resolution]
+            self.video_link, self.video_size = video_streams[Settings.get_default().video_resolution]
         if self.audio:
-            self.audio_link = audio_streams[Settings.get_default().audio_quality]
+            self.audio_link, self.audio_size = audio_streams[Settings.get_default().audio_quality]
 
         self._update_properties(api_json)
         name = self._assemble_name()
@@ -187,79 +305,146 @@ class Coub:
 
     @cancellable
     async def _download(self):
+        # Streams that get merged and removed afterwards don't need to touch the disk
+        # Only audio qualifies, as looping the video requires a seekable input
+        # The buffer counts against the transfer budget until the merge, if it doesn't fit it's a file after all
+        # Video and audio are reserved together, holding the buffer while waiting for the video can deadlock
+        self._drop_audio_data()
+        reserved = 0
+        if self.video and self.audio and not Settings.get_default().keep_streams:
+            reserved = self.video_size + self.audio_size
+            if budget.transfer.try_acquire(reserved):
+                self.buffered = reserved
+                self.audio_data = io.BytesIO()
+            else:
+                reserved = 0
+
+        video_file = self._stage(self.video_file)
+        audio_file = self._stage(self.audio_file)
+
         args = []
         if self.video:
-            args.append([self.video_link, self.video_file, self.session])
+            args.append([self.video_link, video_file, self.session, self.container.add_bytes, self.video_size,
+                         None, bool(reserved)])
         if self.audio:
-            args.append([self.audio_link, self.audio_file, self.session])
+            args.append([self.audio_link, audio_file, self.session, self.container.add_bytes, self.audio_size,
+                         self.audio_data, bool(reserved)])
 
         tasks = [save_stream(*a) for a in args]
-        await asyncio.gather(*tasks)
+        self.container.streams += len(tasks)
+        try:
+            verified = await asyncio.gather(*tasks)
+        finally:
+            self.container.streams -= len(tasks)
+            # Only the buffer is still in memory, the video share was for its transfer
+            if reserved:
+                budget.transfer.release(self.video_size)
+                self.buffered -= self.video_size
+        self.verified = {a[1] for a, v in zip(args, verified) if v}
 
         # After this point the file won't be removed when the program quits
         # Don't do it later to not mess with FFmpeg's automatic format detection
         if self.video:
-            self.video_file.with_suffix(f"{self.video_file.suffix}.gyre").replace(self.video_file)
-        if self.audio:
-            self.audio_file.with_suffix(f"{self.audio_file.suffix}.gyre").replace(self.audio_file)
+            get_temp_file(video_file).replace(video_file)
+            remove_partial_info(get_temp_file(video_file))
+        if self.audio and not self.audio_data:
+            get_temp_file(audio_file).replace(audio_file)
+            remove_partial_info(get_temp_file(audio_file))
 
     @cancellable
-    def _check_integrity(self):
-        if self.video and file_corrupted(self.video_file):
-            fix_old_storage_method(self.video_file)
+    async def _check_integrity(self):
+        video_file = self._stage(self.video_file)
+        audio_file = self._stage(self.audio_file)
+
+        # Both streams get checked at the same time
+        files = []
+        if self.video:
+            files.append(video_file)
+        if self.audio:
+            files.append(audio_file)
+        # Streams checked during the download don't need another look
+        files = [f for f in files if f not in self.verified]
+        data = {audio_file: self.audio_data.getvalue()} if self.audio_data else {}
+        corrupted = await asyncio.gather(*[file_corrupted(f, data.get(f)) for f in files])
+        corrupted = dict(zip(files, corrupted))
+
+        if corrupted.get(video_file):
+            fix_old_storage_method(video_file)
             # Video files have a chance of being fixed, so check again
-            if file_corrupted(self.video_file):
-                raise CoubCorruptedError(self.video_file)
+            if await file_corrupted(video_file):
+                raise CoubCorruptedError(video_file)
 
-        if self.audio and file_corrupted(self.audio_file):
-            raise CoubCorruptedError(self.audio_file)
+        if corrupted.get(audio_file):
+            raise CoubCorruptedError(audio_file)
 
     @cancellable
-    def _merge_streams(self):
+    async def _merge_streams(self):
         # temp_file uses prefix to not mess with FFmpeg's automatic muxer detection
         temp_file = pathlib.Path(self.merged_file.parent, f"temp_{self.merged_file.name}")
-        concat_file = self.merged_file.with_suffix(".txt")
-
-        with concat_file.open("w") as f:
-            for _ in range(Settings.get_default().loop_limit):
-                print(f"file '{self.video_file}'", file=f)
 
+        # Looping the input directly spares us the concat list
+        loops = max(Settings.get_default().loop_limit, 1) - 1
         command = [
             "ffmpeg", "-y", "-v", "error",
-            "-f", "concat", "-safe", "0",
-            "-i", str(concat_file),
-            "-i", str(self.audio_file),
+            "-stream_loop", str(loops),
+            "-i", str(self._stage(self.video_file)),
         ]
+        if self.audio_data:
+            command.extend(["-f", "mp3", "-i", "pipe:0"])
+        else:
+            command.extend(["-i", str(self._stage(self.audio_file))])
         if Settings.get_default().duration_limit:
             command.extend(["-t", Settings.get_default().duration_limit])
         command.extend(["-c", "copy", "-shortest", str(temp_file)])
 
-        subprocess.run(command, check=False)
+        data = self.audio_data.getvalue() if self.audio_data else None
+        await ffmpeg.run(command, input=data)
 
-        concat_file.unlink()
         # necessary as FFmpeg can't change files in-place, if merge ext is mp4
         temp_file.replace(self.merged_file)
 
     @cancellable
     async def process(self):
-        retries = Settings.get_default().retry_attempts
-        attempt = 0
-        while retries < 0 or attempt <= retries:
+        policy = RetryPolicy()
+        while True:
             try:
                 if not (self.video_link or self.audio_link):
-                    await self._fetch_infos()
+                    async with stages.api.slot(self.container):
+                        await self._fetch_infos()
                 self._check_existence()
-                await self._download()
-                self._check_integrity()
-                if self.audio and self.video and not Settings.get_default().download_share_version:
-                    self._merge_streams()
+                if not self.sized:
+                    self.container.add_size(self._get_size())
+                    # Decided only once, so retries can resume their partial downloads
+                    self._claim_staging()
+                    self.sized = True
+                async with stages.cdn.slot(self.container):
+                    await self._download()
+                async with stages.post.slot(self.container):
+                    await self._check_integrity()
+                    await self._store_streams()
+                    if self.audio and self.video and not Settings.get_default().download_share_version:
+                        await self._merge_streams()
+                    await self._publish()
                 if Settings.get_default().archive:
                     self._log_archive_entry()
                 if Settings.get_default().info_json:
                     self._log_infos()
                 break
-            except (ClientError, json.decoder.JSONDecodeError):
-                attempt += 1
+            except (ClientError, json.decoder.JSONDecodeError) as error:
+                if isinstance(error, ClientResponseError) and error.status in STALE_LINK_STATUS:
+                    # Stream links from cached infos may have expired in the meantime
+                    metadata.invalidate(self.id)
+                    self.page_json = None
+                    self.video_link = ""
+                    self.audio_link = ""
+                if not await policy.backoff(error):
+                    if isinstance(error, StreamCorruptedError):
+                        write_error_log(f"{error.path.name} corrupted")
+                    else:
+                        write_error_log(f"https://coub.com/view/{self.id} couldn't be downloaded")
+                    # Counted, so incremental downloads don't move their watermark past it
+                    self.container.invalid += 1
+                    break
             except CoubUnavailableError:
                 write_error_log(f"https://coub.com/view/{self.id} is unavailable")
                 self.container.invalid += 1
@@ -272,6 +457,11 @@ class Coub:
                 write_error_log(f"{error.path.name} corrupted")
                 self.container.invalid += 1
                 break
+            except (CancelledError, asyncio.CancelledError):
+                # Staged streams would otherwise occupy the (usually RAM-backed) staging area until logout
+                self._remove_staged()
+                self._drop_audio_data()
+                raise
 
         self._finish()
 
@@ -345,6 +535,8 @@ def get_stream_lists(api_json):
     #     html5 video higher
     #     html5 video med in a non-broken state (doesn't require \x00\x00 fix)
 
+    # Streams are returned as (url, size) pairs, sizes are 0 or None if unknown
+
     # Api returns "error: Coub not found" if Coub unavailable
     if "error" in api_json:
         return ([], [])
@@ -354,7 +546,7 @@ def get_stream_lists(api_json):
         share = api_json["file_versions"]["share"]["default"]
         # Non-existence results in None or '{}' (the latter is rare)
         if share and share != "{}":
-            return ([share], [])
+            return ([(share, 0)], [])
         return ([], [])
 
     # Video streams
@@ -368,7 +560,7 @@ def get_stream_lists(api_json):
         if f in available and available[f]["size"]:
             # html5 stream sizes can be 0 or None in case of a missing stream
             # None is the exception and an irregularity in the Coub API
-            video.append(available[f]["url"])
+            video.append((available[f]["url"], available[f]["size"]))
 
     # Audio streams
     try:
@@ -378,7 +570,7 @@ def get_stream_lists(api_json):
         audio = []
         for f in formats:
             if f in available and available[f]["size"]:
-                audio.append(available[f]["url"])
+                audio.append((available[f]["url"], available[f]["size"]))
     except KeyError:
         # No audio
         audio = []
@@ -386,27 +578,235 @@ def get_stream_lists(api_json):
     return (video, audio)
 
 
+def get_download_size(api_json):
+    # Size of the streams a coub would download with the current settings (0 if unknown)
+    video_streams, audio_streams = get_stream_lists(api_json)
+    share = Settings.get_default().download_share_version
+
+    size = 0
+    if video_streams and (Settings.get_default().download_video or share):
+        size += video_streams[Settings.get_default().video_resolution][1] or 0
+    if audio_streams and Settings.get_default().download_audio and not share:
+        size += audio_streams[Settings.get_default().audio_quality][1] or 0
+
+    return size
+
+
 @cancellable
-async def save_chunk(stream, file):
-    chunk = await stream.content.read(Settings.get_default().download_chunk_size)
+async def save_chunk(stream, writer, size, on_data, check=None):
+    chunk = await stream.content.read(size)
 
     if not chunk:
         return False
 
-    file.write(chunk)
+    await limiter.cdn.consume(len(chunk))
+    # Cheaper to fix the header of old coubs right away than after the download
+    if not writer.position:
+        chunk = fix_header(chunk)
+    if check:
+        check.feed(chunk)
+    await writer.write(chunk)
+    on_data(len(chunk))
 
     return True
 
 
+def get_temp_file(path):
+    # Open file with .gyre suffix to easily distinguish temp files
+    # .gyre was chosen, to ensure no accidental file erasure (possible with .part)
+    return path.with_suffix(f"{path.suffix}.gyre")
+
+
+def get_partial_info_file(temp_file):
+    return temp_file.with_name(f"{temp_file.name}.json")
+
+
+def read_partial_info(temp_file, link):
+    info_file = get_partial_info_file(temp_file)
+    if not (temp_file.exists() and info_file.exists()):
+        return None
+
+    try:
+        info = json.loads(info_file.read_text())
+    except (OSError, ValueError):
+        return None
+
+    if info.get("url") != link or not info.get("size"):
+        return None
+    # Without a validator we can't know whether the remote file changed in the meantime
+    if not info.get("validator"):
+        return None
+
+    return info
+
+
+def get_total_size(response):
+    if response.status != 206:
+        return response.content_length
+
+    # Content-Range: bytes <start>-<end>/<total>
+    size = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(size) if size.isdigit() else None
+
+
+def write_partial_info(temp_file, link, response):
+    size = get_total_size(response)
+
+    # Weak ETags aren't allowed in If-Range
+    validator = response.headers.get("ETag")
+    if not validator or validator.startswith("W/"):
+        validator = response.headers.get("Last-Modified")
+
+    info = {"url": link, "size": size, "validator": validator}
+    get_partial_info_file(temp_file).write_text(json.dumps(info))
+
+
+def remove_partial_info(temp_file):
+    get_partial_info_file(temp_file).unlink(missing_ok=True)
+
+
+@cancellable
+async def save_response(stream, file, offset, on_data, check=None):
+    # Read size is tuned once per stream instead of queried for every chunk
+    size = get_read_size(stream.content_length)
+    async with StreamWriter(file, offset) as writer:
+        chunk = True
+        while chunk:
+            chunk = await save_chunk(stream, writer, size, on_data, check)
+
+    return writer.offset
+
+
+@cancellable
+async def save_segment(link, temp_file, segment, progress, session, on_data, reserved=False):
+    start, end = segment
+    headers = {"Range": f"bytes={start}-{end}"}
+    # Same order as in save_stream (files -> CDN slot -> transfer), anything else can deadlock
+    files = budget.files.hold(budget.FILES_PER_TRANSFER)
+    transfer = budget.transfer.hold(0 if reserved else end - start + 1)
+    async with files, concurrency.cdn.slot() as slot, transfer:
+        async with session.get(link, headers=headers) as stream:
+            slot.record(stream)
+            stream.raise_for_status()
+            if stream.status != 206:
+                raise ClientPayloadError(f"Range request for {link} not honoured")
+
+            with temp_file.open("r+b") as f:
+                progress[segment] = await save_response(stream, f, start, on_data)
+
+
+@cancellable
+async def save_segments(link, temp_file, start, total, session, on_data, reserved=False):
+    # Segments share the session's connection limit with everything else
+    count = min(Settings.get_default().download_segments, Settings.get_default().connections)
+    length = max(SEGMENT_SIZE, math.ceil((total - start) / count))
+    segments = [(s, min(s + length, total) - 1) for s in range(start, total, length)]
+
+    progress = {}
+    tasks = [
+        asyncio.ensure_future(save_segment(link, temp_file, s, progress, session, on_data, reserved))
+        for s in segments
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Only keep the contiguous beginning, so the partial stays resumable
+        contiguous = start
+        for segment in segments:
+            contiguous = progress.get(segment, segment[0])
+            if contiguous <= segment[1]:
+                break
+        with temp_file.open("r+b") as f:
+            f.truncate(contiguous)
+        raise
+
+
 @cancellable
-async def save_stream(link, path, session):
-    async with session.get(link) as stream:
-        # Open file with .gyre suffix to easily distinguish temp files
-        # .gyre was chosen, to ensure no accidental file erasure (possible with .part)
-        with path.with_suffix(f"{path.suffix}.gyre").open("wb") as f:
-            chunk = True
-            while chunk:
-                chunk = await save_chunk(stream, f)
+async def save_stream(link, path, session, on_data, size=0, buffer=None, reserved=False):
+    # Returns whether the stream was fully checked while downloading
+    # Streams with a buffer end up in there instead of a file (no resuming or segments)
+    # Reserved streams already hold their share of the transfer budget
+    temp_file = get_temp_file(path)
+    network.learn(link)
+
+    # Streams in the store already passed a full check
+    store = contentstore.store
+    if store and buffer is not None:
+        data = await store.read(link, size)
+        if data is not None:
+            buffer.write(data)
+            on_data(len(data), reused=True)
+            return True
+    elif store and await store.fetch(link, size, temp_file):
+        # The old file may be another link to the same entry, renaming onto it would do nothing
+        path.unlink(missing_ok=True)
+        on_data(size, reused=True)
+        return True
+
+    offset = 0
+    headers = {}
+    info = None
+    if Settings.get_default().resume_downloads and buffer is None:
+        info = read_partial_info(temp_file, link)
+    if info:
+        offset = temp_file.stat().st_size
+        if offset >= info["size"]:
+            return False
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = info["validator"]
+    elif Settings.get_default().download_segments > 1 and buffer is None:
+        # The first segment doubles as a test for Range support
+        # Servers without it simply send the whole file
+        headers["Range"] = f"bytes=0-{SEGMENT_SIZE - 1}"
+
+    check = None
+    files = budget.files.hold(budget.FILES_PER_TRANSFER)
+    try:
+        async with files, concurrency.cdn.slot() as slot:
+            async with session.get(link, headers=headers) as stream:
+                slot.record(stream)
+                stream.raise_for_status()
+
+                # Server ignored the range or the file changed -> start from scratch
+                if stream.status != 206:
+                    offset = 0
+                if not offset and buffer is None:
+                    write_partial_info(temp_file, link, stream)
+                if not offset:
+                    # Only streams received in order from the first byte can be checked on the fly
+                    check = validate.get_stream_check(path, size)
+
+                # The size is only known once the headers arrived
+                held = 0 if reserved else stream.content_length or 0
+                async with budget.transfer.hold(held):
+                    target = nullcontext(buffer) if buffer is not None else temp_file.open("r+b" if offset else "wb")
+                    with target as f:
+                        f.truncate(offset)
+                        offset = await save_response(stream, f, offset, on_data, check)
+
+                total = get_total_size(stream)
+
+        if not info and total and offset < total:
+            await save_segments(link, temp_file, offset, total, session, on_data, reserved)
+            return False
+
+        return bool(check and check.finish())
+    except validate.CorruptedError:
+        # Broken data must not be resumed by the next attempt
+        remove_partial_info(temp_file)
+        raise StreamCorruptedError(path)
+
+
+def fix_header(chunk):
+    # The first box of a MP4 (ftyp) is tiny, so its size never starts with anything but zeros
+    if chunk[4:8] == b"ftyp" and chunk[:2] != b"\x00\x00":
+        return b"\x00\x00" + chunk[2:]
+
+    return chunk
 
 
 @cancellable
@@ -414,16 +814,23 @@ def fix_old_storage_method(path):
     # Coub used to store videos in a broken state and fixed them before playback
     # They stopped doing this when they introduced the watermarks
     # Some old coubs might still be stored like this
+    # Only the first two bytes are broken, so there's no need to rewrite the whole file
     with path.open("r+b") as f:
-        temp = f.read()
-    with path.open("w+b") as f:
-        f.write(b'\x00\x00' + temp[2:])
+        f.write(b"\x00\x00")
 
 
 @cancellable
-def file_corrupted(path):
-    command = ["ffmpeg", "-v", "error", "-i", str(path), "-t", "1", "-f", "null", "-"]
-    out = subprocess.run(command, capture_output=True, text=True, check=False)
+async def file_corrupted(path, data=None):
+    # data replaces the file's content for streams kept in memory
+    # Most streams can be judged without spawning FFmpeg
+    valid = validate.check_file(path, data)
+    if valid is not None:
+        return not valid
+
+    source = "pipe:0" if data is not None else str(path)
+    command = ["ffmpeg", "-v", "error", "-i", source, "-t", "1", "-f", "null", "-"]
+    out = await ffmpeg.run(command, input=data, capture_output=True)
+    stderr = out.stderr.decode(errors="replace")
 
     # Checks against typical error messages
     # "Header missing"/"Failed to read frame size" -> audio corruption
@@ -436,7 +843,7 @@ def file_corrupted(path):
         "moov atom not found",
     ]
     for error in typical:
-        if error in out.stderr:
+        if error in stderr:
             return True
 
     return False
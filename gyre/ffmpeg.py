@@ -0,0 +1,58 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+import subprocess
+
+from gyre.settings import Settings
+from gyre.utils import cancellable
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# FFmpeg runs in these threads, so it doesn't block the event loop
+# Its size is the max. number of FFmpeg processes at once
+executor = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def init():
+    global executor
+
+    # 0 -> one process per CPU core
+    jobs = Settings.get_default().ffmpeg_jobs or os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="gyre-ffmpeg")
+
+
+def uninit():
+    global executor
+
+    if executor:
+        executor.shutdown(wait=False)
+    executor = None
+
+
+@cancellable
+async def run(command, **kwargs):
+    func = partial(subprocess.run, command, check=False, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, func)
@@ -0,0 +1,151 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+
+from gyre.settings import Settings
+from gyre.utils import evict_oldest, get_cache_dir, run_blocking, write_stats_log
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+cache = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class HTTPCache:
+    """
+    On-disk cache for API responses with validators (ETag/Last-Modified)
+    Entries are revalidated with conditional requests and evicted in LRU order
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evicting = False
+
+        if not self.path.exists():
+            self.path.mkdir()
+        self.size = sum(f.stat().st_size for f in self.path.iterdir())
+
+    def _get_file(self, url):
+        return self.path / hashlib.sha1(url.encode()).hexdigest()
+
+    def _get(self, url):
+        # Entry layout: one line of JSON metadata, followed by the raw body
+        try:
+            meta, _, body = self._get_file(url).read_bytes().partition(b"\n")
+            meta = json.loads(meta)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("url") != url:
+            return None
+        meta["body"] = body
+
+        return meta
+
+    async def get(self, url):
+        # Returns None if there's no usable entry
+        return await run_blocking(self._get, url)
+
+    def get_headers(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def _touch(self, url):
+        # mtime doubles as last access time for the LRU order
+        try:
+            os.utime(self._get_file(url))
+        except OSError:
+            pass
+
+    async def hit(self, url):
+        self.hits += 1
+        await run_blocking(self._touch, url)
+
+    def _store(self, entry, meta, body):
+        # Returns the change in size
+        old_size = entry.stat().st_size if entry.exists() else 0
+        entry.write_bytes(json.dumps(meta).encode() + b"\n" + body)
+
+        return entry.stat().st_size - old_size
+
+    async def store(self, url, headers, body):
+        self.misses += 1
+
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        # Responses without validators can't be revalidated, so there's no point in keeping them
+        if not (meta["etag"] or meta["last_modified"]):
+            return
+
+        self.size += await run_blocking(self._store, self._get_file(url), meta, body)
+
+        # Entries added in the meantime get covered by the next eviction
+        if self.size > self.max_size and not self.evicting:
+            self.evicting = True
+            try:
+                self.size -= await run_blocking(evict_oldest, self.path, self.size, self.max_size)
+            finally:
+                self.evicting = False
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def init():
+    global cache
+
+    # Size is stored in MiB, 0 disables the cache
+    max_size = Settings.get_default().http_cache_size*1024*1024
+    cache = HTTPCache(get_cache_dir() / "http", max_size) if max_size else None
+
+
+def uninit():
+    global cache
+
+    cache = None
+
+
+def log_summary():
+    if not cache:
+        return
+
+    requests = cache.hits + cache.misses
+    if requests:
+        write_stats_log(
+            f"HTTP cache: {cache.hits} of {requests} API responses still valid ({cache.hits/requests:.0%} hit rate)"
+        )
+
+    cache.hits = 0
+    cache.misses = 0
@@ -85,6 +85,8 @@ class AddWindow(Handy.Window):
     list_button = Gtk.Template.Child("placeholder")
     sort_dropdown = Gtk.Template.Child("sort_dropdown")
     limit_spin_button = Gtk.Template.Child("limit_spin_button")
+    priority_dropdown = Gtk.Template.Child("priority_dropdown")
+    pin_check = Gtk.Template.Child("pin_check")
 
     SUPPORTED_FORMATS = {
         "Coub": {
@@ -278,6 +280,8 @@ class AddWindow(Handy.Window):
         self.id = self.item.id if self.item else ""
         self.sort = self.item.sort if self.item else ""
         self.limit = self.item.quantity if self.item else 0
+        self.priority = self.item.priority if self.item else "Normal"
+        self.pinned = self.item.pinned if self.item else False
 
         if self.item:
             self.add_button.set_label("Update")
@@ -313,6 +317,11 @@ class AddWindow(Handy.Window):
         self.sort_dropdown.connect("notify::active", self._on_sort_changed)
         self.limit_spin_button.connect("value-changed", self._on_spin_button_changed)
 
+        self.priority_dropdown.set_active_id(self.priority)
+        self.pin_check.set_active(self.pinned)
+        self.priority_dropdown.connect("changed", self._on_priority_changed)
+        self.pin_check.connect("toggled", self._on_pin_toggled)
+
         # Disable add button until input was provided
         self.add_button.set_sensitive(False)
 
@@ -407,6 +416,12 @@ class AddWindow(Handy.Window):
     def _on_spin_button_changed(self, *args):
         self.limit = self.limit_spin_button.get_value_as_int()
 
+    def _on_priority_changed(self, dropdown):
+        self.priority = dropdown.get_active_id()
+
+    def _on_pin_toggled(self, check_button):
+        self.pinned = check_button.get_active()
+
     def _on_add_clicked(self, *args):
         # Switching types may preserve unnecessary ID or sort
         if not self.SUPPORTED_FORMATS[self.type]["need_id"]:
@@ -414,7 +429,7 @@ class AddWindow(Handy.Window):
         if not self.SUPPORTED_FORMATS[self.type]["sort_list"]:
             self.sort = ""
 
-        new = create_container(self.type, self.id, self.sort, self.limit)
+        new = create_container(self.type, self.id, self.sort, self.limit, self.priority, self.pinned)
         if self.item:
             pos = self.model.find(self.item)[1]
             self.model.splice(pos, 1, [new])
@@ -66,10 +66,13 @@ class PreferenceWindow(Handy.PreferencesWindow):
 
     # Network
     connections_spin_button = Gtk.Template.Child("connections_spin_button")
+    api_limit_spin_button = Gtk.Template.Child("api_limit_spin_button")
+    cdn_limit_spin_button = Gtk.Template.Child("cdn_limit_spin_button")
     retries_spin_button = Gtk.Template.Child("retries_spin_button")
 
     # Limits and Filters
     recoubs_row = Gtk.Template.Child("recoubs_row")
+    order_row = Gtk.Template.Child("order_row")
 
     # Automatization
     auto_remove_switch = Gtk.Template.Child("auto_remove_switch")
@@ -209,6 +212,29 @@ class PreferenceWindow(Handy.PreferencesWindow):
         )
         self.connections_spin_button.connect("notify::value", self._on_connections_changed)
 
+        # Bandwidth Limits
+        self.api_limit_spin_button.set_adjustment(
+            Gtk.Adjustment(
+                value=self.settings.api_bandwidth_limit,
+                lower=0,
+                upper=9999999,
+                step_increment=64,
+                page_increment=1024,
+            )
+        )
+        self.api_limit_spin_button.connect("notify::value", self._on_api_limit_changed)
+
+        self.cdn_limit_spin_button.set_adjustment(
+            Gtk.Adjustment(
+                value=self.settings.cdn_bandwidth_limit,
+                lower=0,
+                upper=9999999,
+                step_increment=64,
+                page_increment=1024,
+            )
+        )
+        self.cdn_limit_spin_button.connect("notify::value", self._on_cdn_limit_changed)
+
         # Retries
         self.retries_spin_button.set_adjustment(
             Gtk.Adjustment(
@@ -230,6 +256,15 @@ class PreferenceWindow(Handy.PreferencesWindow):
         self.recoubs_row.set_selected_index(self.settings.download_recoubs)
         self.recoubs_row.connect('notify::selected-index', self._on_recoubs_download_changed)
 
+        # Download order
+        liststore = Gio.ListStore.new(Handy.ValueObject)
+        for order in ["List Order", "Shortest First", "Largest First"]:
+            liststore.append(Handy.ValueObject.new(order))
+
+        self.order_row.bind_name_model(liststore, Handy.ValueObject.dup_string)
+        self.order_row.set_selected_index(self.settings.download_order)
+        self.order_row.connect('notify::selected-index', self._on_download_order_changed)
+
         # Auto remove
         self.auto_remove_switch.set_active(self.settings.auto_remove)
         self.auto_remove_switch.connect("notify::active", self._on_auto_remove_changed)
@@ -393,12 +428,21 @@ class PreferenceWindow(Handy.PreferencesWindow):
     def _on_connections_changed(self, spin_button, prop_name):
         self.settings.connections = spin_button.get_value_as_int()
 
+    def _on_api_limit_changed(self, spin_button, prop_name):
+        self.settings.api_bandwidth_limit = spin_button.get_value_as_int()
+
+    def _on_cdn_limit_changed(self, spin_button, prop_name):
+        self.settings.cdn_bandwidth_limit = spin_button.get_value_as_int()
+
     def _on_retries_changed(self, spin_button, prop_name):
         self.settings.retry_attempts = spin_button.get_value_as_int()
 
     def _on_recoubs_download_changed(self, combo_row, prop_name):
         self.settings.download_recoubs = combo_row.get_selected_index()
 
+    def _on_download_order_changed(self, combo_row, prop_name):
+        self.settings.download_order = combo_row.get_selected_index()
+
     def _on_auto_remove_changed(self, toggle_button, prop_name):
         self.settings.auto_remove = toggle_button.get_active()
 
@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
 
-from gi.repository import Gtk, GLib
+from gi.repository import Gtk, GLib, GObject
 
 from gyre.utils import translate_community_name
 from gyre.settings import Settings
@@ -31,6 +31,7 @@ class InputRow(Gtk.ListBoxRow):
 
     main_label = Gtk.Template.Child("main_label")
     subtitle = Gtk.Template.Child("subtitle")
+    pin_button = Gtk.Template.Child("pin_button")
     edit_button = Gtk.Template.Child("edit_button")
     delete_button = Gtk.Template.Child("delete_button")
     progress_bar = Gtk.Template.Child("progress_bar")
@@ -52,13 +53,24 @@ class InputRow(Gtk.ListBoxRow):
             f": {item_id}" if item_id else "",
             f" (limit: {self.item.quantity})" if self.item.quantity else "",
         ]))
-        self.subtitle.set_label(f"sorted by '{self.item.sort}'" if self.item.sort else "")
+        self.subtitle.set_label(", ".join(filter(None, [
+            f"sorted by '{self.item.sort}'" if self.item.sort else "",
+            f"{self.item.priority.lower()} priority" if self.item.priority != "Normal" else "",
+        ])))
+
+        # Pinning also works while downloading, so it's not tied to the edit dialog
+        self.item.bind_property(
+            "pinned", self.pin_button, "active",
+            GObject.BindingFlags.BIDIRECTIONAL | GObject.BindingFlags.SYNC_CREATE,
+        )
 
         self.edit_button.connect("clicked", self._on_edit)
         self.delete_button.connect("clicked", self._on_delete)
         self.item.connect("notify::page-progress", lambda *args: GLib.idle_add(self._on_progress_update))
         self.item.connect("notify::done", lambda *args: GLib.idle_add(self._on_progress_update))
         self.item.connect("notify::count", lambda *args: GLib.idle_add(self._on_progress_update))
+        self.item.connect("notify::done-bytes", lambda *args: GLib.idle_add(self._on_progress_update))
+        self.item.connect("notify::streams", lambda *args: GLib.idle_add(self._on_progress_update))
         self.item.connect("notify::complete", lambda *args: GLib.idle_add(self._on_progress_update))
         self.item.connect("notify::error", lambda *args: GLib.idle_add(self._on_progress_update))
 
@@ -101,13 +113,33 @@ class InputRow(Gtk.ListBoxRow):
             self.progress_bar.set_text(self.item.error_msg)
         # Download progress
         elif self.item.count:
+            eta = self.item.get_eta()
             self.progress_bar.set_fraction(self.item.done/self.item.count)
             self.progress_bar.set_text(" ".join([
                 "Downloading coubs...",
                 f"({self.item.done}/{self.item.count})",
+                f"({format_rate(self.item.rate)}, avg. {format_rate(self.item.get_average_rate())},",
+                f"{self.item.streams} streams)",
+                f"(~{format_duration(eta)} left)" if eta is not None else "",
                 f"({self.item.exist} exist)" if self.item.exist else "",
                 f"({self.item.invalid} errors)" if self.item.invalid else "",
             ]))
         # Parsing progress
         elif self.item.page_progress:
             self.progress_bar.set_fraction(self.item.page_progress/self.item.pages)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def format_rate(rate):
+    return f"{rate/1000/1000:.1f} MB/s"
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
@@ -0,0 +1,90 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from gyre.settings import Settings
+from gyre.utils import SLEEP_STEP, sleep
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# How many seconds worth of traffic may be sent in a single burst
+BURST = 1
+
+# Separate budgets for the Coub API and the CDN serving the streams
+api = None
+cdn = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class TokenBucket:
+    """
+    Process-wide token bucket
+    Every consumer draws from the same budget, so the limit applies to the sum of all transfers
+    """
+
+    def __init__(self, rate=0):
+        # Bytes per second, 0 means unlimited
+        self.rate = rate
+        self.tokens = 0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.tokens = min(self.tokens, rate*BURST)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated)*self.rate, self.rate*BURST)
+        self.updated = now
+
+    async def consume(self, amount):
+        if not self.rate:
+            return
+
+        self._refill()
+        # Going into debt allows reads larger than the bucket itself
+        self.tokens -= amount
+        while self.tokens < 0 and self.rate:
+            # Re-check regularly, as the rate can change while we wait
+            await sleep(min(-self.tokens/self.rate, SLEEP_STEP))
+            self._refill()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def _update_rates(*args):
+    # Limits are stored in KiB/s
+    api.set_rate(Settings.get_default().api_bandwidth_limit*1024)
+    cdn.set_rate(Settings.get_default().cdn_bandwidth_limit*1024)
+
+
+def init():
+    global api, cdn
+
+    api = TokenBucket()
+    cdn = TokenBucket()
+
+    # Limits can be changed at any time, even during a download
+    Settings.get_default().connect("changed::api-bandwidth-limit", _update_rates)
+    Settings.get_default().connect("changed::cdn-bandwidth-limit", _update_rates)
+    _update_rates()
@@ -0,0 +1,124 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import time
+
+from gyre.settings import Settings
+from gyre.utils import get_cache_dir, run_blocking
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Fields of the coub API response, which are needed to download a coub
+FIELDS = ["title", "created_at", "channel", "tags", "communities", "file_versions"]
+
+# Ordered from oldest to newest, so expired and excess entries are always at the front
+entries = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def get_metadata_file():
+    return get_cache_dir() / "metadata.json"
+
+
+def init():
+    global entries
+
+    entries = {}
+    if not Settings.get_default().metadata_cache_ttl:
+        return
+
+    try:
+        loaded = json.loads(get_metadata_file().read_text())
+    except (OSError, ValueError):
+        return
+
+    entries = dict(sorted(loaded.items(), key=lambda item: item[1]["time"]))
+    prune()
+
+
+def prune():
+    # Drops expired entries and the oldest ones beyond the size limit
+    ttl = Settings.get_default().metadata_cache_ttl*60
+    limit = Settings.get_default().metadata_cache_entries
+    now = time.time()
+    while entries:
+        oldest = next(iter(entries))
+        if now - entries[oldest]["time"] < ttl and len(entries) <= limit:
+            break
+        del entries[oldest]
+
+
+def write_metadata_file(content):
+    get_metadata_file().write_text(json.dumps(content))
+
+
+async def save():
+    if entries is None or not Settings.get_default().metadata_cache_ttl:
+        return
+
+    prune()
+    # Entries are replaced, never changed, so a shallow copy is safe to write from another thread
+    await run_blocking(write_metadata_file, dict(entries))
+
+
+async def uninit():
+    global entries
+
+    await save()
+    entries = None
+
+
+def is_complete(api_json):
+    return "error" not in api_json and all(f in api_json for f in FIELDS)
+
+
+def get(coub):
+    if not entries or coub not in entries:
+        return None
+
+    entry = entries[coub]
+    if time.time() - entry["time"] >= Settings.get_default().metadata_cache_ttl*60:
+        del entries[coub]
+        return None
+
+    return entry["data"]
+
+
+def add(coub, api_json):
+    if entries is None or not Settings.get_default().metadata_cache_ttl:
+        return
+    # Unavailable coubs and incomplete responses aren't worth caching
+    if not is_complete(api_json):
+        return
+
+    # Re-added entries move to the end
+    entries.pop(coub, None)
+    entries[coub] = {
+        "time": time.time(),
+        "data": {f: api_json[f] for f in FIELDS},
+    }
+    prune()
+
+
+def invalidate(coub):
+    if entries:
+        entries.pop(coub, None)
@@ -0,0 +1,143 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from gyre import concurrency, limiter
+from gyre.settings import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+API_HOST = "https://coub.com"
+# How long to keep resolved addresses and idle connections (in seconds)
+DNS_CACHE_TTL = 600
+KEEPALIVE_TIMEOUT = 60
+# Extra idle time on top of the repeat interval, so connections survive until the next run
+KEEPALIVE_MARGIN = 60
+# Upper limit for the warm-up, so it never delays a download for long
+WARM_UP_TIMEOUT = 10
+
+# CDN hosts seen in stream links, kept for the whole application lifetime
+cdn_hosts = set()
+
+manager = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class SessionManager:
+    """
+    Keeps one client session alive across repeated downloads
+    The session is only rebuilt if settings it depends on change
+    """
+
+    def __init__(self):
+        self.session = None
+        self.config = None
+        self.warm_up_task = None
+
+    def _get_keepalive(self):
+        # Idle connections would otherwise be closed long before the next repeated download
+        if Settings.get_default().repeat_download:
+            return max(KEEPALIVE_TIMEOUT, Settings.get_default().repeat_interval*60 + KEEPALIVE_MARGIN)
+        return KEEPALIVE_TIMEOUT
+
+    def _get_config(self):
+        return (Settings.get_default().connections, self._get_keepalive())
+
+    async def get(self):
+        config = self._get_config()
+        if self.session and (config != self.config or self.session.closed):
+            await self.close()
+
+        if not self.session:
+            tout = aiohttp.ClientTimeout(total=None)
+            # API and CDN requests are limited by their own controllers (up to connections each)
+            conn = aiohttp.TCPConnector(
+                limit=Settings.get_default().connections*2,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                keepalive_timeout=self._get_keepalive(),
+            )
+            self.session = aiohttp.ClientSession(timeout=tout, connector=conn)
+            self.config = config
+
+        return self.session
+
+    async def _warm_up_host(self, host, controller, bucket):
+        # Counts against the same limits as the requests it prepares for
+        try:
+            async with controller.slot() as slot:
+                async with self.session.head(host, allow_redirects=False) as response:
+                    slot.record(response)
+                    size = sum(len(k) + len(v) for k, v in response.raw_headers)
+            await bucket.consume(size)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+    async def _warm_up(self):
+        tasks = [self._warm_up_host(API_HOST, concurrency.api, limiter.api)]
+        tasks.extend(self._warm_up_host(h, concurrency.cdn, limiter.cdn) for h in cdn_hosts)
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), WARM_UP_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    def warm_up(self):
+        # Runs alongside the first requests, so DNS and handshakes overlap with them
+        if Settings.get_default().warm_up_connections and not self.warm_up_task:
+            self.warm_up_task = asyncio.ensure_future(self._warm_up())
+
+    async def finish_run(self):
+        if self.warm_up_task:
+            self.warm_up_task.cancel()
+            await asyncio.gather(self.warm_up_task, return_exceptions=True)
+        self.warm_up_task = None
+
+    async def close(self):
+        await self.finish_run()
+        if self.session:
+            await self.session.close()
+        self.session = None
+        self.config = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def learn(link):
+    url = urlsplit(link)
+    cdn_hosts.add(f"{url.scheme}://{url.netloc}")
+
+
+def init():
+    global manager
+
+    manager = SessionManager()
+
+
+async def uninit():
+    global manager
+
+    if manager:
+        await manager.close()
+    manager = None
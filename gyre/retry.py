@@ -0,0 +1,141 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+
+from aiohttp import ClientConnectionError, ClientResponseError
+
+from gyre.settings import Settings
+from gyre.utils import sleep, write_stats_log
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Exponential backoff: BASE_DELAY * 2^n, capped and fully jittered
+BASE_DELAY = 0.5
+MAX_DELAY = 60
+# Upper limit for waits requested by the server via Retry-After
+MAX_RETRY_AFTER = 300
+
+# Budgets per error class as a multiple of the retry setting
+# Being throttled isn't a problem with the request itself, so allow it more often
+BUDGETS = {
+    "connection": 1,
+    "throttled": 2,
+    "server": 1,
+    "response": 1,
+}
+
+# Totals since the last summary
+retries = 0
+waited = 0
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class RetryPolicy:
+    """
+    Decides whether to retry after an error and waits accordingly
+    One instance represents the attempt budget of a coub or a whole container
+    """
+
+    def __init__(self):
+        self.attempts = {}
+        self.retries = 0
+        self.waited = 0
+
+    def _allowed(self, error_class):
+        limit = Settings.get_default().retry_attempts
+        if limit < 0:
+            return True
+
+        return self.attempts.get(error_class, 0) <= limit*BUDGETS[error_class]
+
+    def _delay(self, error_class, error):
+        attempt = self.attempts[error_class]
+        delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**min(attempt-1, 16)))
+
+        if isinstance(error, ClientResponseError):
+            delay = max(delay, get_retry_after(error))
+
+        return delay
+
+    async def backoff(self, error):
+        # Returns False if there are no attempts left for this kind of error
+        global retries, waited
+
+        error_class = classify(error)
+        self.attempts[error_class] = self.attempts.get(error_class, 0) + 1
+        if not self._allowed(error_class):
+            return False
+
+        delay = self._delay(error_class, error)
+        await sleep(delay)
+
+        self.retries += 1
+        self.waited += delay
+        retries += 1
+        waited += delay
+
+        return True
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def classify(error):
+    if isinstance(error, ClientResponseError):
+        if error.status in (429, 503):
+            return "throttled"
+        if error.status >= 500:
+            return "server"
+    if isinstance(error, ClientConnectionError):
+        return "connection"
+
+    # Invalid or incomplete responses (e.g. JSON decode errors, payload errors)
+    return "response"
+
+
+def get_retry_after(error):
+    value = (error.headers or {}).get("Retry-After")
+    if not value:
+        return 0
+
+    # Either delta-seconds or an HTTP date
+    if value.isdigit():
+        delay = int(value)
+    else:
+        try:
+            delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return 0
+
+    return min(max(delay, 0), MAX_RETRY_AFTER)
+
+
+def log_summary():
+    global retries, waited
+
+    if retries:
+        write_stats_log(f"Retried {retries} requests, spent {waited:.1f}s waiting")
+
+    retries = 0
+    waited = 0
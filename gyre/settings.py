@@ -116,6 +116,22 @@ class Settings(Gio.Settings):
     def keep_streams(self, value):
         self.set_boolean("keep-streams", value)
 
+    @property
+    def staging(self):
+        return self.get_boolean("staging")
+
+    @staging.setter
+    def staging(self, value):
+        self.set_boolean("staging", value)
+
+    @property
+    def staging_path(self):
+        return self.get_string("staging-path")
+
+    @staging_path.setter
+    def staging_path(self, value):
+        self.set_string("staging-path", value)
+
     @property
     def download_video(self):
         return self.get_boolean("download-video")
@@ -180,6 +196,22 @@ class Settings(Gio.Settings):
     def connections(self, value):
         self.set_int("connections", value)
 
+    @property
+    def api_bandwidth_limit(self):
+        return self.get_int("api-bandwidth-limit")
+
+    @api_bandwidth_limit.setter
+    def api_bandwidth_limit(self, value):
+        self.set_int("api-bandwidth-limit", value)
+
+    @property
+    def cdn_bandwidth_limit(self):
+        return self.get_int("cdn-bandwidth-limit")
+
+    @cdn_bandwidth_limit.setter
+    def cdn_bandwidth_limit(self, value):
+        self.set_int("cdn-bandwidth-limit", value)
+
     @property
     def retry_attempts(self):
         return self.get_int("retry-attempts")
@@ -188,6 +220,118 @@ class Settings(Gio.Settings):
     def retry_attempts(self, value):
         self.set_int("retry-attempts", value)
 
+    @property
+    def download_segments(self):
+        return self.get_int("download-segments")
+
+    @download_segments.setter
+    def download_segments(self, value):
+        self.set_int("download-segments", value)
+
+    @property
+    def http_cache_size(self):
+        return self.get_int("http-cache-size")
+
+    @http_cache_size.setter
+    def http_cache_size(self, value):
+        self.set_int("http-cache-size", value)
+
+    @property
+    def content_store_size(self):
+        return self.get_int("content-store-size")
+
+    @content_store_size.setter
+    def content_store_size(self, value):
+        self.set_int("content-store-size", value)
+
+    @property
+    def content_store_age(self):
+        return self.get_int("content-store-age")
+
+    @content_store_age.setter
+    def content_store_age(self, value):
+        self.set_int("content-store-age", value)
+
+    @property
+    def metadata_cache_ttl(self):
+        return self.get_int("metadata-cache-ttl")
+
+    @metadata_cache_ttl.setter
+    def metadata_cache_ttl(self, value):
+        self.set_int("metadata-cache-ttl", value)
+
+    @property
+    def metadata_cache_entries(self):
+        return self.get_int("metadata-cache-entries")
+
+    @metadata_cache_entries.setter
+    def metadata_cache_entries(self, value):
+        self.set_int("metadata-cache-entries", value)
+
+    @property
+    def resume_downloads(self):
+        return self.get_boolean("resume-downloads")
+
+    @resume_downloads.setter
+    def resume_downloads(self, value):
+        self.set_boolean("resume-downloads", value)
+
+    @property
+    def api_workers(self):
+        return self.get_int("api-workers")
+
+    @api_workers.setter
+    def api_workers(self, value):
+        self.set_int("api-workers", value)
+
+    @property
+    def cdn_workers(self):
+        return self.get_int("cdn-workers")
+
+    @cdn_workers.setter
+    def cdn_workers(self, value):
+        self.set_int("cdn-workers", value)
+
+    @property
+    def post_workers(self):
+        return self.get_int("post-workers")
+
+    @post_workers.setter
+    def post_workers(self, value):
+        self.set_int("post-workers", value)
+
+    @property
+    def ffmpeg_jobs(self):
+        return self.get_int("ffmpeg-jobs")
+
+    @ffmpeg_jobs.setter
+    def ffmpeg_jobs(self, value):
+        self.set_int("ffmpeg-jobs", value)
+
+    @property
+    def warm_up_connections(self):
+        return self.get_boolean("warm-up-connections")
+
+    @warm_up_connections.setter
+    def warm_up_connections(self, value):
+        self.set_boolean("warm-up-connections", value)
+
+    @property
+    def parallel_coubs(self):
+        return self.get_int("parallel-coubs")
+
+    @parallel_coubs.setter
+    def parallel_coubs(self, value):
+        self.set_int("parallel-coubs", value)
+
+    @property
+    def transfer_size_limit(self):
+        return self.get_int("transfer-size-limit")
+
+    @transfer_size_limit.setter
+    def transfer_size_limit(self, value):
+        self.set_int("transfer-size-limit", value)
+
     @property
     def download_recoubs(self):
         return self.get_enum("download-recoubs")
@@ -196,6 +340,14 @@ class Settings(Gio.Settings):
     def download_recoubs(self, value):
         self.set_enum("download-recoubs", value)
 
+    @property
+    def download_order(self):
+        return self.get_enum("download-order")
+
+    @download_order.setter
+    def download_order(self, value):
+        self.set_enum("download-order", value)
+
     @property
     def auto_remove(self):
         return self.get_boolean("auto-remove")
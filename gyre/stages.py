@@ -0,0 +1,180 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import os
+import time
+
+from gi.repository import GObject
+
+from gyre.settings import Settings
+from gyre.utils import write_stats_log
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Coub info resolution, stream transfers and checking/merging
+api = None
+cdn = None
+post = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class Stage(GObject.GObject):
+    """
+    Limits how many coubs can be in one step of their processing at once
+    Free slots are shared between containers like the workers are, so no
+    item queues behind all coubs of another one
+    Keeps track of the queue in front of it and how busy its slots are
+    """
+
+    waiting = GObject.Property(type=int, default=0)
+    active = GObject.Property(type=int, default=0)
+
+    def __init__(self, name, size):
+        super().__init__()
+        self.name = name
+        self.size = max(1, size)
+        # Waiting coubs per container, in order of arrival
+        self._queues = {}
+        # Counters for the smooth weighted round-robin
+        self._current = {}
+        # Slots handed to waiters, which didn't resume yet
+        self._handed = 0
+
+        self.peak_waiting = 0
+        # Slot-seconds spent busy, to calculate the average occupancy
+        self.busy = 0
+        self.started = time.monotonic()
+        self.last_change = self.started
+
+    def _account(self):
+        now = time.monotonic()
+        self.busy += self.active*(now - self.last_change)
+        self.last_change = now
+
+    def _next(self):
+        # Same smooth weighted round-robin as the worker pool, pinned containers first
+        waiting = list(self._queues)
+        candidates = [c for c in waiting if c.pinned] or waiting
+
+        total = 0
+        for container in candidates:
+            self._current[container] += container.get_weight()
+            total += container.get_weight()
+        container = max(candidates, key=self._current.get)
+        self._current[container] -= total
+
+        return container
+
+    def _remove(self, container, future):
+        queue = self._queues.get(container)
+        if queue and future in queue:
+            queue.remove(future)
+        if not queue:
+            self._queues.pop(container, None)
+            self._current.pop(container, None)
+
+    def _wake(self):
+        while self._queues and self.active + self._handed < self.size:
+            container = self._next()
+            future = self._queues[container][0]
+            self._remove(container, future)
+            future.set_result(None)
+            self._handed += 1
+
+    async def _acquire(self, container):
+        if self.active + self._handed < self.size and not self._queues:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(container, deque()).append(future)
+        self._current.setdefault(container, 0)
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await future
+        except BaseException:
+            # Pass on a slot we got right before being cancelled
+            if future.done() and not future.cancelled():
+                self._handed -= 1
+                self._wake()
+            else:
+                self._remove(container, future)
+            future.cancel()
+            raise
+        finally:
+            self.waiting -= 1
+
+        self._handed -= 1
+
+    @asynccontextmanager
+    async def slot(self, container):
+        await self._acquire(container)
+
+        self._account()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self._account()
+            self.active -= 1
+            self._wake()
+
+    def get_occupancy(self):
+        self._account()
+        elapsed = self.last_change - self.started
+        if not elapsed:
+            return 0
+
+        return self.busy/(elapsed*self.size)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def init():
+    global api, cdn, post
+
+    api = Stage("API", Settings.get_default().api_workers)
+    cdn = Stage("CDN", Settings.get_default().cdn_workers)
+    # 0 -> one coub per CPU core
+    post = Stage("Post-processing", Settings.get_default().post_workers or os.cpu_count() or 1)
+
+
+def uninit():
+    global api, cdn, post
+
+    api = None
+    cdn = None
+    post = None
+
+
+def log_summary():
+    for stage in [api, cdn, post]:
+        # Nothing to report, if the stage was never used
+        if not (stage and stage.busy):
+            continue
+        write_stats_log(
+            f"{stage.name} stage: {stage.get_occupancy():.0%} of {stage.size} slots busy, "
+            f"max. {stage.peak_waiting} coubs queued"
+        )
@@ -0,0 +1,150 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import errno
+import os
+import pathlib
+import shutil
+
+from gyre.settings import Settings
+from gyre.utils import remove_partials
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Assumed for coubs, whose stream sizes the API doesn't report
+UNKNOWN_SIZE = 32*1024*1024
+# Always left free, as a RAM disk shares its space with everything else in memory
+RESERVED_SPACE = 256*1024*1024
+
+area = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class StagingArea:
+    """
+    Directory for streams and partial downloads before they reach the output path
+    Coubs claim space up front, so parallel downloads can't overfill it together
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.claimed = 0
+
+    def claim(self, size):
+        # Returns the claimed size, 0 if the coub has to do without staging
+        size = size or UNKNOWN_SIZE
+        try:
+            free = shutil.disk_usage(self.path).free
+        except OSError:
+            return 0
+
+        if free - self.claimed - size < RESERVED_SPACE:
+            return 0
+        self.claimed += size
+
+        return size
+
+    def release(self, size):
+        self.claimed -= size
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def get_path():
+    # Returns None if there's no suitable location
+    if Settings.get_default().staging_path:
+        return pathlib.Path(Settings.get_default().staging_path)
+
+    # Usually a tmpfs, but only exists on systems with a session manager
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime:
+        return None
+
+    return pathlib.Path(runtime, "gyre")
+
+
+def publish(source, target):
+    # Moves a finished file out of the staging area, which may be on a different file system
+    try:
+        source.replace(target)
+        return
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+
+    # Copy next to the target first, so a partial copy never has the final name
+    temp_file = target.with_name(f"temp_{target.name}")
+    try:
+        shutil.copyfile(source, temp_file)
+        temp_file.replace(target)
+    except OSError:
+        temp_file.unlink(missing_ok=True)
+        raise
+    source.unlink()
+
+
+def sweep(path, own):
+    # Nothing downloads yet, so everything in here was left behind by an earlier run or a crash
+    # A RAM disk would otherwise hold on to it until logout
+    remove_partials(path, stale_only=Settings.get_default().resume_downloads)
+    # Other files in a custom location might not be ours
+    if not own:
+        return
+
+    for entry in path.iterdir():
+        if entry.name.endswith((".gyre", ".gyre.json")):
+            continue
+        try:
+            entry.unlink()
+        except OSError:
+            pass
+
+
+def init():
+    global area
+
+    path = get_path() if Settings.get_default().staging else None
+    # Staging in the output path itself would only add extra moves
+    if not path or path == pathlib.Path(Settings.get_default().output_path):
+        area = None
+        return
+
+    try:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        sweep(path, own=not Settings.get_default().staging_path)
+    except OSError:
+        area = None
+        return
+
+    area = StagingArea(path)
+
+
+def uninit():
+    global area
+
+    if area:
+        # Removes the directory only if nothing got left behind
+        try:
+            area.path.rmdir()
+        except OSError:
+            pass
+    area = None
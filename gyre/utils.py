@@ -16,7 +16,7 @@
 # along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
-from functools import wraps
+from functools import partial, wraps
 import json
 import pathlib
 import threading
@@ -32,6 +32,15 @@ from gyre.settings import Settings
 
 CANCELLED = False
 
+# Max. time async sleeps wait before checking for cancellation
+SLEEP_STEP = 0.5
+
+# Caches evict down to this fraction of their limit, so not every new entry triggers eviction
+EVICTION_TARGET = 0.9
+
+# Partial downloads older than this (in seconds) aren't worth resuming anymore
+PARTIAL_MAX_AGE = 24*60*60
+
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Decorators
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -85,6 +94,35 @@ def cancel_download():
     CANCELLED = True
 
 
+async def run_blocking(func, *args):
+    # For file operations, which may take long enough to stall all downloads
+    return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args))
+
+
+def evict_oldest(path, size, max_size):
+    # Removes the least recently modified files of a directory and returns the freed size
+    freed = 0
+    for entry in sorted(path.iterdir(), key=lambda f: f.stat().st_mtime):
+        if size - freed <= max_size*EVICTION_TARGET:
+            break
+        freed += entry.stat().st_size
+        entry.unlink(missing_ok=True)
+
+    return freed
+
+
+async def sleep(delay):
+    # Sleep in short steps, so cancelling doesn't have to wait for long delays
+    end = time.monotonic() + delay
+    while True:
+        if CANCELLED:
+            raise CancelledError
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(remaining, SLEEP_STEP))
+
+
 def get_cache_dir():
     cache_dir = pathlib.Path(GLib.get_user_cache_dir())
 
@@ -103,6 +141,22 @@ def is_flatpak():
     return pathlib.Path(GLib.get_user_runtime_dir(), "flatpak-info").exists()
 
 
+def remove_partials(folder, stale_only=False):
+    # Removes partial downloads (.gyre) and their resume infos (.gyre.json)
+    limit = time.time() - PARTIAL_MAX_AGE
+    for partial in folder.glob("*.gyre"):
+        try:
+            if stale_only and partial.stat().st_mtime >= limit:
+                continue
+            partial.unlink()
+        except OSError:
+            pass
+    # Infos are worthless without their partial
+    for info in folder.glob("*.gyre.json"):
+        if not info.with_suffix("").exists():
+            info.unlink(missing_ok=True)
+
+
 def get_error_log():
     error_log = get_cache_dir() / "error.log"
 
@@ -117,6 +171,12 @@ def write_error_log(error):
         print(f"[{time.asctime()}] {error}", file=f)
 
 
+def write_stats_log(message):
+    # Statistics of a download run, kept out of the error log shown to users
+    with (get_cache_dir() / "stats.log").open("a") as f:
+        print(f"[{time.asctime()}] {message}", file=f)
+
+
 def import_profile(path, liststore):
     from gyre.container import create_container
 
@@ -139,6 +199,8 @@ def export_profile(path, liststore):
         "loop_limit",
         "duration_limit",
         "keep_streams",
+        "staging",
+        "staging_path",
         "download_video",
         "video_resolution",
         "max_video_resolution",
@@ -147,8 +209,25 @@ def export_profile(path, liststore):
         "audio_quality",
         "download_share_version",
         "connections",
+        "api_bandwidth_limit",
+        "cdn_bandwidth_limit",
         "retry_attempts",
+        "download_segments",
+        "http_cache_size",
+        "content_store_size",
+        "content_store_age",
+        "metadata_cache_ttl",
+        "metadata_cache_entries",
+        "resume_downloads",
+        "api_workers",
+        "cdn_workers",
+        "post_workers",
+        "ffmpeg_jobs",
+        "warm_up_connections",
+        "parallel_coubs",
+        "transfer_size_limit",
         "download_recoubs",
+        "download_order",
         "auto_remove",
         "repeat_download",
         "repeat_interval",
@@ -173,7 +252,9 @@ def export_profile(path, liststore):
                 "type": item.type,
                 "id": item.id,
                 "sort": item.sort,
-                "quantity": item.quantity
+                "quantity": item.quantity,
+                "priority": item.priority,
+                "pinned": item.pinned,
             } for item in liststore
         ]
     }
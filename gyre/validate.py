@@ -0,0 +1,557 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import struct
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Fields of a visual sample entry (e.g. avc1) before its child boxes
+VISUAL_SAMPLE_ENTRY_SIZE = 78
+# Don't read absurdly large first samples of broken files into memory
+MAX_SAMPLE_SIZE = 16*1024*1024
+# Regular H.264 NAL unit types (0 and 24-31 are unspecified)
+NAL_TYPES = range(1, 24)
+
+# MPEG audio layer III, indexed by [MPEG-1][index]
+MP3_BITRATES = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Indexed by [version bits][index]
+MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+# Roughly one second of audio, the same span FFmpeg gets to decode
+MP3_FRAMES = 40
+# How far to look for the first frame after the ID3 tag
+MP3_SYNC_WINDOW = 4096
+# ID3v1 tags are a fixed-size block at the end of the file
+ID3V1_SIZE = 128
+# The header needs to be in memory while the stream is checked on the fly
+MAX_MOOV_SIZE = 8*1024*1024
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class CorruptedError(Exception):
+    pass
+
+
+class UnknownFormatError(Exception):
+    pass
+
+
+class StreamCheck:
+    """
+    Structural check of a stream while it's still being downloaded
+    Only the bytes later parts of the check depend on are kept in memory
+    Subclasses provide _check, which runs whenever new data arrived
+    """
+
+    def __init__(self, size=0):
+        # Expected length according to the API (0 if unknown)
+        self.size = size or 0
+        self.length = 0
+        # Absolute offset of the first byte still in memory
+        self.start = 0
+        # Bytes before this offset aren't needed anymore
+        self.keep = 0
+        self.data = bytearray()
+        self.final = False
+        # Set if the stream can't be judged without FFmpeg
+        self.skipped = False
+        # Set if the stream doesn't match the size from the API
+        self.mismatch = False
+
+    def feed(self, chunk):
+        self.length += len(chunk)
+        self._check_size(self.length)
+        if self.skipped:
+            return
+
+        self.data += chunk
+        self._run()
+
+    def finish(self):
+        # Returns True if the whole stream passed, False if FFmpeg has to decide
+        self.final = True
+        if self.size and self.length != self.size:
+            self.mismatch = True
+        if not self.skipped:
+            self._run()
+
+        return not (self.skipped or self.mismatch)
+
+    def _check_size(self, end):
+        # The API size is only a hint, the structure has to prove the file broken
+        if self.size and end > self.size:
+            self.mismatch = True
+
+    def peek(self, offset, size):
+        # Returns None if the bytes didn't arrive yet
+        if offset + size > self.length:
+            return None
+
+        offset -= self.start
+        return bytes(self.data[offset:offset+size])
+
+    def _run(self):
+        try:
+            self._check()
+        except (UnknownFormatError, struct.error):
+            self.skipped = True
+            self.data.clear()
+            return
+
+        drop = min(self.keep, self.length) - self.start
+        if drop > 0:
+            del self.data[:drop]
+            self.start += drop
+
+
+class MP4Check(StreamCheck):
+
+    def __init__(self, size=0):
+        super().__init__(size)
+        # Start of the next top-level box (None if the last one extends to the end)
+        self.next_box = 0
+        self.boxes = set()
+        # (start, end) of moov, while it's still arriving
+        self.moov = None
+        # (offset, size, NAL length size) of the first video sample, while it's still arriving
+        self.sample = None
+
+    def _check(self):
+        while self._next_box():
+            pass
+        if self.moov:
+            self._read_moov()
+        if self.sample:
+            self._read_sample()
+
+        offsets = [self.length if self.next_box is None else self.next_box]
+        offsets.extend(pending[0] for pending in (self.moov, self.sample) if pending)
+        self.keep = min(offsets)
+
+        if self.final:
+            self._conclude()
+
+    def _next_box(self):
+        offset = self.next_box
+        header = self.peek(offset, 8) if offset is not None else None
+        if not header:
+            return False
+
+        size, kind = struct.unpack(">I4s", header)
+        header = 8
+        if size == 1:
+            large = self.peek(offset + 8, 8)
+            if not large:
+                return False
+            size = struct.unpack(">Q", large)[0]
+            header = 16
+        elif size == 0:
+            # Extends to the end of the stream
+            size = None
+
+        if size is not None:
+            if size < header:
+                raise CorruptedError
+            self._check_size(offset + size)
+        if not all(32 <= c < 127 for c in kind):
+            raise CorruptedError
+
+        self.boxes.add(kind)
+        if kind == b"moov":
+            if size is None or size > MAX_MOOV_SIZE:
+                raise UnknownFormatError
+            self.moov = (offset, offset + size)
+
+        self.next_box = offset + size if size is not None else None
+        return self.next_box is not None
+
+    def _read_moov(self):
+        start, end = self.moov
+        data = self.peek(start, end - start)
+        if data is None:
+            return
+        self.moov = None
+
+        # The file-based parsers work just as well on the in-memory box
+        f = io.BytesIO(data)
+        header = 16 if struct.unpack(">I", data[:4])[0] == 1 else 8
+        stbl = find_video_track(f, (header, len(data)))
+        if not stbl:
+            return
+
+        length_size = get_nal_length_size(f, stbl)
+        offset, size = get_first_sample(f, stbl)
+        if size > MAX_SAMPLE_SIZE:
+            raise CorruptedError
+        self._check_size(offset + size)
+        # moov after mdat, the sample is already gone
+        if offset < self.start:
+            raise UnknownFormatError
+
+        self.sample = (offset, size, length_size)
+
+    def _read_sample(self):
+        offset, size, length_size = self.sample
+        data = self.peek(offset, size)
+        if data is None:
+            return
+        self.sample = None
+
+        check_nal_units(data, length_size)
+
+    def _conclude(self):
+        # The stream ended before the header or sample arrived
+        if self.moov or self.sample:
+            raise CorruptedError
+        if self.next_box is not None and self.next_box > self.length:
+            raise CorruptedError
+
+        if b"moov" not in self.boxes:
+            if b"moof" in self.boxes:
+                raise UnknownFormatError
+            raise CorruptedError
+        if b"mdat" not in self.boxes:
+            raise UnknownFormatError
+
+
+class MP3Check(StreamCheck):
+
+    def __init__(self, size=0):
+        super().__init__(size)
+        # End of the ID3 tag, None until its header arrived
+        self.tag_end = None
+        # Offset of the next frame header, None until the first frame was found
+        self.next_frame = None
+        self.frames = 0
+
+    def _check(self):
+        if self.tag_end is None:
+            self._read_tag()
+        if self.tag_end is not None and self.next_frame is None:
+            self._find_start()
+        if self.next_frame is not None:
+            self._read_frames()
+
+        if self.next_frame is None:
+            self.keep = self.tag_end or 0
+        elif self.frames < MP3_FRAMES:
+            self.keep = self.next_frame
+        else:
+            self.keep = self.length
+
+    def _read_tag(self):
+        header = self.peek(0, 10)
+        if header is None:
+            if not self.final:
+                return
+            header = self.peek(0, self.length)
+
+        self.tag_end = get_id3_size(header)
+
+    def _find_start(self):
+        window = self.peek(self.tag_end, MP3_SYNC_WINDOW)
+        complete = window is not None or self.final
+        if window is None:
+            window = self.peek(self.tag_end, max(self.length - self.tag_end, 0)) or b""
+
+        # The first match is final, no matter how much of the window arrived yet
+        start = find_mp3_sync(window)
+        if start is not None:
+            self.next_frame = self.tag_end + start
+        elif complete:
+            # Could just be a lot of padding or another tag, FFmpeg has to decide
+            raise UnknownFormatError
+
+    def _read_frames(self):
+        while self.frames < MP3_FRAMES:
+            header = self.peek(self.next_frame, 4)
+            if header is None:
+                return
+
+            size = get_mp3_frame_size(header)
+            if not size:
+                # ID3v1 tag at the very end
+                if header[:3] != b"TAG" or self.length - self.next_frame > ID3V1_SIZE:
+                    raise CorruptedError
+                if not self.final:
+                    return
+                if self.length - self.next_frame != ID3V1_SIZE:
+                    raise CorruptedError
+                self.frames = MP3_FRAMES
+                return
+
+            self.next_frame += size
+            self.frames += 1
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def check_file(path, data=None):
+    """
+    Structural check of a downloaded stream without decoding it
+    data replaces the file's content, if the stream was kept in memory
+    Returns True (valid), False (corrupted) or None (FFmpeg has to decide)
+    """
+    checks = {".mp4": check_mp4, ".mp3": check_mp3}
+    check = checks.get(path.suffix)
+    if not check:
+        return None
+
+    try:
+        with (io.BytesIO(data) if data is not None else path.open("rb")) as f:
+            length = f.seek(0, 2)
+            check(f, length)
+    except CorruptedError:
+        return False
+    except (UnknownFormatError, OSError, struct.error):
+        return None
+
+    return True
+
+
+def get_stream_check(path, size=0):
+    # Returns None for files without a streaming check
+    checks = {".mp4": MP4Check, ".mp3": MP3Check}
+    check = checks.get(path.suffix)
+    if not check:
+        return None
+
+    return check(size)
+
+
+def read_at(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) < size:
+        raise CorruptedError
+
+    return data
+
+
+def iter_boxes(f, start, end):
+    # Yields (type, payload start, box end) for all boxes in a range
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack(">I4s", read_at(f, offset, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", read_at(f, offset + 8, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+
+        # Coub's old storage method breaks the very first size field
+        if size < header or offset + size > end or not all(32 <= c < 127 for c in kind):
+            raise CorruptedError
+
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def find_box(f, start, end, kind):
+    for child, child_start, child_end in iter_boxes(f, start, end):
+        if child == kind:
+            return child_start, child_end
+
+    return None
+
+
+def find_video_track(f, moov):
+    for kind, start, end in iter_boxes(f, *moov):
+        if kind != b"trak":
+            continue
+
+        mdia = find_box(f, start, end, b"mdia")
+        hdlr = find_box(f, *mdia, b"hdlr") if mdia else None
+        # Version/flags and pre_defined come before the handler type
+        if hdlr and read_at(f, hdlr[0] + 8, 4) == b"vide":
+            minf = find_box(f, *mdia, b"minf")
+            stbl = find_box(f, *minf, b"stbl") if minf else None
+            if not stbl:
+                raise CorruptedError
+            return stbl
+
+    return None
+
+
+def get_nal_length_size(f, stbl):
+    stsd = find_box(f, *stbl, b"stsd")
+    if not stsd:
+        raise CorruptedError
+
+    # Version/flags and entry count come before the sample entries
+    for kind, start, end in iter_boxes(f, stsd[0] + 8, stsd[1]):
+        if kind not in (b"avc1", b"avc3"):
+            raise UnknownFormatError
+        avcc = find_box(f, start + VISUAL_SAMPLE_ENTRY_SIZE, end, b"avcC")
+        if not avcc:
+            raise CorruptedError
+        return (read_at(f, avcc[0] + 4, 1)[0] & 0x03) + 1
+
+    raise CorruptedError
+
+
+def get_first_sample(f, stbl):
+    stsz = find_box(f, *stbl, b"stsz")
+    if not stsz:
+        raise CorruptedError
+    size, count = struct.unpack(">II", read_at(f, stsz[0] + 4, 8))
+    if not count:
+        raise CorruptedError
+    if not size:
+        size = struct.unpack(">I", read_at(f, stsz[0] + 12, 4))[0]
+
+    stco = find_box(f, *stbl, b"stco")
+    if stco:
+        offset = struct.unpack(">I", read_at(f, stco[0] + 8, 4))[0]
+    else:
+        co64 = find_box(f, *stbl, b"co64")
+        if not co64:
+            raise CorruptedError
+        offset = struct.unpack(">Q", read_at(f, co64[0] + 8, 8))[0]
+
+    return offset, size
+
+
+def check_nal_units(sample, length_size):
+    pos = 0
+    while pos < len(sample):
+        nal_size = int.from_bytes(sample[pos:pos+length_size], "big")
+        pos += length_size
+        if not nal_size or pos + nal_size > len(sample):
+            raise CorruptedError
+
+        # forbidden_zero_bit must be unset
+        header = sample[pos]
+        if header & 0x80 or header & 0x1F not in NAL_TYPES:
+            raise CorruptedError
+        pos += nal_size
+
+
+def check_mp4(f, length):
+    boxes = {kind: (start, end) for kind, start, end in iter_boxes(f, 0, length)}
+
+    if b"moov" not in boxes:
+        # Fragmented files keep their samples elsewhere
+        if b"moof" in boxes:
+            raise UnknownFormatError
+        raise CorruptedError
+    if b"mdat" not in boxes:
+        raise UnknownFormatError
+
+    stbl = find_video_track(f, boxes[b"moov"])
+    if not stbl:
+        return
+
+    # Only the first sample is checked, the rest would require decoding anyway
+    length_size = get_nal_length_size(f, stbl)
+    offset, size = get_first_sample(f, stbl)
+    if size > MAX_SAMPLE_SIZE or offset + size > length:
+        raise CorruptedError
+
+    check_nal_units(read_at(f, offset, size), length_size)
+
+
+def get_mp3_frame_size(header):
+    # Returns None if there's no valid frame header
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate = header[2] >> 4
+    sample_rate = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version == 1 or not layer or bitrate == 15 or sample_rate == 3:
+        return None
+    # Other layers and free format bitrates never show up on Coub
+    if layer != 1 or not bitrate:
+        raise UnknownFormatError
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[mpeg1][bitrate]*1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate]
+
+    return (144 if mpeg1 else 72)*bitrate//sample_rate + padding
+
+
+def get_id3_size(header):
+    # Returns 0 if there's no ID3v2 tag at the start
+    if header[:3] != b"ID3" or len(header) < 10:
+        return 0
+
+    # Synchsafe integer (7 bits per byte), plus optional footer
+    size = 10 + sum((b & 0x7F) << (7*(3-i)) for i, b in enumerate(header[6:10]))
+    if header[5] & 0x10:
+        size += 10
+
+    return size
+
+
+def find_mp3_sync(window):
+    # Returns None if there's no frame header in the window
+    for i in range(len(window) - 3):
+        try:
+            if get_mp3_frame_size(window[i:i+4]):
+                return i
+        except UnknownFormatError:
+            # Only trust it, if it's where the first frame should be
+            if not i:
+                raise
+
+    return None
+
+
+def find_mp3_start(f, length):
+    offset = get_id3_size(read_at(f, 0, min(10, length)))
+
+    # Encoders sometimes leave padding between tag and first frame
+    window = read_at(f, offset, max(min(MP3_SYNC_WINDOW, length - offset), 0))
+    start = find_mp3_sync(window)
+    if start is None:
+        # Could just be a lot of padding or another tag, FFmpeg has to decide
+        raise UnknownFormatError
+
+    return offset + start
+
+
+def check_mp3(f, length):
+    offset = find_mp3_start(f, length)
+
+    for _ in range(MP3_FRAMES):
+        if offset + 4 > length:
+            break
+        header = read_at(f, offset, 4)
+        size = get_mp3_frame_size(header)
+        if not size:
+            # ID3v1 tag at the very end
+            if header[:3] == b"TAG" and length - offset == ID3V1_SIZE:
+                break
+            raise CorruptedError
+        offset += size
@@ -0,0 +1,85 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+from gyre.settings import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Settings, which decide whether and as what a coub ends up in the output path
+# If any of them changes, already seen coubs have to be checked again
+KEY_SETTINGS = [
+    "output_path",
+    "file_extension",
+    "name_template",
+    "overwrite",
+    "keep_streams",
+    "download_video",
+    "video_resolution",
+    "max_video_resolution",
+    "min_video_resolution",
+    "download_audio",
+    "audio_quality",
+    "download_share_version",
+    "download_recoubs",
+    "archive",
+    "archive_path",
+    "output_list",
+    "allow_unicode",
+]
+
+# Newest creation date seen per container request and settings
+# Only kept for one repeat session, as the output path may change in between without us noticing
+marks = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def init():
+    global marks
+
+    marks = {}
+
+
+def uninit():
+    global marks
+
+    marks = None
+
+
+def get_key(template):
+    settings = Settings.get_default()
+    return "|".join([template, *[str(getattr(settings, s)) for s in KEY_SETTINGS]])
+
+
+def get(template):
+    if not marks:
+        return None
+
+    return marks.get(get_key(template))
+
+
+def update(template, created_at):
+    # Creation dates are ISO 8601 strings in UTC, so they compare correctly as strings
+    if marks is None or not created_at:
+        return
+
+    key = get_key(template)
+    if key not in marks or created_at > marks[key]:
+        marks[key] = created_at
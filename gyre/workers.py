@@ -0,0 +1,172 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import heapq
+import itertools
+
+from gyre.coub import Coub, get_download_size
+from gyre.settings import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Share of the workers a container gets relative to others
+PRIORITY_WEIGHTS = {
+    "Low": 1,
+    "Normal": 2,
+    "High": 4,
+}
+
+pool = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class JobState:
+    """Queued and outstanding coubs of a single container"""
+
+    def __init__(self, container, limit):
+        self.container = container
+        # Heap of (order, sequence number, job)
+        self.queue = []
+        self.limit = limit
+        self.space = asyncio.Event()
+        self.space.set()
+        # Counter for the smooth weighted round-robin
+        self.current = 0
+
+        self.pending = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.error = None
+
+    @property
+    def weight(self):
+        return self.container.get_weight()
+
+
+class WorkerPool:
+    """
+    Fixed number of workers, which download coubs from all containers
+    Containers get a share of the workers according to their priority,
+    pinned containers are served before everyone else
+    """
+
+    def __init__(self, session, size):
+        self.session = session
+        self.size = max(1, size)
+        self.jobs = {}
+        # Counts queued coubs, so a worker only wakes up if there's something to do
+        self.queued = asyncio.Semaphore(0)
+        self.sequence = itertools.count()
+        self.tasks = [asyncio.ensure_future(self._work()) for _ in range(size)]
+
+    async def submit(self, container, coub_id, page_json=None):
+        state = self.jobs.get(container)
+        if not state:
+            state = self.jobs[container] = JobState(container, self.size)
+
+        # Containers can only queue as many coubs as there are workers to take them
+        while len(state.queue) >= state.limit:
+            state.space.clear()
+            await state.space.wait()
+
+        heapq.heappush(state.queue, (get_order(page_json), next(self.sequence), (coub_id, page_json)))
+        state.pending += 1
+        state.idle.clear()
+        self.queued.release()
+
+    async def join(self, container):
+        # Waits for all coubs of a container and raises the first error they ran into
+        state = self.jobs.get(container)
+        if not state:
+            return
+
+        await state.idle.wait()
+        del self.jobs[container]
+        if state.error:
+            raise state.error
+
+    def _next(self):
+        waiting = [s for s in self.jobs.values() if s.queue]
+        candidates = [s for s in waiting if s.container.pinned] or waiting
+
+        total = 0
+        for state in candidates:
+            state.current += state.weight
+            total += state.weight
+        state = max(candidates, key=lambda s: s.current)
+        state.current -= total
+
+        _, _, job = heapq.heappop(state.queue)
+        state.space.set()
+
+        return state, job
+
+    async def _work(self):
+        while True:
+            await self.queued.acquire()
+            state, (coub_id, page_json) = self._next()
+            try:
+                await Coub(coub_id, state.container, self.session, page_json).process()
+            except Exception as error:
+                if not state.error:
+                    state.error = error
+            finally:
+                state.pending -= 1
+                if not state.pending:
+                    state.idle.set()
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def get_order(page_json):
+    # Coubs without page infos (single coubs, lists) have an unknown size and keep their order
+    order = Settings.get_default().download_order
+    if not order or not page_json:
+        return 0
+
+    try:
+        size = get_download_size(page_json)
+    except (KeyError, TypeError):
+        # Malformed infos are handled once the coub gets processed
+        return 0
+
+    return size if order == 1 else -size
+
+
+def init(session):
+    global pool
+
+    pool = WorkerPool(session, Settings.get_default().parallel_coubs)
+
+
+async def uninit():
+    global pool
+
+    if pool:
+        await pool.close()
+    pool = None
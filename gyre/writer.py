@@ -0,0 +1,130 @@
+# Copyright (C) 2020-2024 HelpSeeker <AlmostSerious@protonmail.ch>
+#
+# This file is part of Gyre.
+#
+# Gyre is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Gyre is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Gyre.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+
+from gyre.settings import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Global variables
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Size at which buffered chunks get handed over to the writer threads
+# Each stream holds two of these buffers (one filling, one being written)
+BUFFER_SIZE = 1024*1024
+
+# Bounds for the per-stream read size
+MIN_READ_SIZE = 64*1024
+MAX_READ_SIZE = 1024*1024
+# Aim for roughly this many reads per stream, if the length is known
+READS_PER_STREAM = 32
+
+# Writes block, so they happen outside of the event loop
+# A handful of threads is plenty, as every write is already coalesced
+EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gyre-writer")
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Classes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class StreamWriter:
+    """
+    Buffered, non-blocking file writer for downloaded streams
+    Collects incoming chunks and writes them in large blocks from a worker thread
+    """
+
+    def __init__(self, file, offset=0):
+        self.file = file
+        self.offset = offset
+
+        self._buffer = bytearray()
+        # Buffer currently owned by the writer thread
+        self._spare = bytearray()
+        self._pending = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        # Flush even on errors, so already downloaded data isn't lost
+        await self.flush()
+
+    @property
+    def position(self):
+        # Where the next write ends up in the file
+        return self.offset + len(self._buffer)
+
+    async def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= BUFFER_SIZE:
+            await self._submit()
+
+    async def flush(self):
+        await self._submit()
+        await self._wait()
+
+    async def _wait(self):
+        if self._pending is None:
+            return
+
+        try:
+            await self._pending
+        finally:
+            self._pending = None
+            self._spare.clear()
+
+    async def _submit(self):
+        # Only one write per stream may be in flight to preserve order
+        await self._wait()
+        if not self._buffer:
+            return
+
+        self._buffer, self._spare = self._spare, self._buffer
+        loop = asyncio.get_running_loop()
+        self._pending = loop.run_in_executor(
+            EXECUTOR, write_at, self.file, self._spare, self.offset
+        )
+        self.offset += len(self._spare)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Functions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def write_at(file, buffer, offset):
+    # In-memory buffers have no file descriptor
+    if isinstance(file, io.BytesIO):
+        file.seek(offset)
+        file.write(buffer)
+        return
+
+    fd = file.fileno()
+    written = os.pwrite(fd, buffer, offset)
+    # Short writes are rare for regular files, but possible
+    while written < len(buffer):
+        written += os.pwrite(fd, buffer[written:], offset + written)
+
+
+def get_read_size(length):
+    # The old per-chunk setting still acts as a lower bound
+    minimum = max(MIN_READ_SIZE, Settings.get_default().download_chunk_size)
+    if not length:
+        return minimum
+
+    return max(minimum, min(length // READS_PER_STREAM, MAX_READ_SIZE))